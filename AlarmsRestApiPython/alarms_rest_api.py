@@ -2,6 +2,7 @@ import json
 import requests
 import identity_provider
 import urllib3
+from concurrent.futures import ThreadPoolExecutor
 
 
 def main():
@@ -18,7 +19,9 @@ def main():
             urllib3.exceptions.InsecureRequestWarning
         )  # Remove this line if verifying the certificate (which is recommended)
 
-    # First we need a session to ensure that we stay logged in
+    # First we need a session to ensure that we stay logged in.
+    # All requests are sent through it, reusing its connections instead of a new connection
+    # and TLS handshake per request
     session = requests.Session()
 
     # Now authenticate using the identity provider and get access token
@@ -42,7 +45,7 @@ def main():
     }
 
     # Get an existing camera
-    response = requests.get(
+    response = session.get(
         f"{serverUrl}/api/rest/v1/cameras", headers=headers, verify=verify
     )
     if response.status_code != 200:
@@ -58,7 +61,7 @@ def main():
         return
 
     # Trigger an alarm
-    response = requests.post(
+    response = session.post(
         f"{serverUrl}/api/rest/v1/alarms",
         headers=headers,
         data=json.dumps(
@@ -79,7 +82,7 @@ def main():
     print(f"Triggered an alarm: {alarm}")
 
     # Retrieve an alarm by id
-    response = requests.get(
+    response = session.get(
         f"{serverUrl}/api/rest/v1/alarms/{alarm['id']}?include=data",
         headers=headers,
         verify=verify,
@@ -96,7 +99,7 @@ def main():
     print(f"Retrieved alarm with id={alarm['id']}: {alarm}")
 
     # Retrieve a random state
-    response = requests.get(
+    response = session.get(
         f"{serverUrl}/api/rest/v1/alarmStates", headers=headers, verify=verify
     )
     if response.status_code != 200:
@@ -111,7 +114,7 @@ def main():
     print(f"Retrieved alarm state with id={alarm_state['id']}: {alarm_state}")
 
     # Retrieve a random priority
-    response = requests.get(
+    response = session.get(
         f"{serverUrl}/api/rest/v1/alarmPriorities", headers=headers, verify=verify
     )
     if response.status_code != 200:
@@ -126,7 +129,7 @@ def main():
     print(f"Retrieved alarm priority with id={alarm_priority['id']}: {alarm_priority}")
 
     # Update an alarm state and priority
-    response = requests.patch(
+    response = session.patch(
         f"{serverUrl}/api/rest/v1/alarms/{alarm['id']}",
         data=json.dumps(
             {
@@ -152,7 +155,7 @@ def main():
     print(f"Updated alarm with id={alarm['id']}: {alarm}")
 
     # Retrieve first 10 alarms
-    response = requests.get(
+    response = session.get(
         f"{serverUrl}/api/rest/v1/alarms?page=0&size=10", headers=headers, verify=verify
     )
     if response.status_code != 200:
@@ -164,7 +167,59 @@ def main():
         return
 
     alarms = response.json()["array"]
-    print(f"Retrieved all alarms: {alarms}")
+    print(f"Retrieved first page of alarms: {alarms}")
+
+    # Walk through all alarms, one page at a time, without loading them all into memory
+    alarm_count = 0
+    for alarm in get_all_pages(
+        session, f"{serverUrl}/api/rest/v1/alarms", headers, verify
+    ):
+        alarm_count += 1
+    print(f"Retrieved {alarm_count} alarms in total")
+
+
+def get_all_pages(
+    session: requests.Session,
+    url: str,
+    headers: dict,
+    verify: bool,
+    page_size: int = 100,
+    params: dict = {},
+):
+    """Yields all items of a list, one page at a time.
+
+    The next page is requested in the background while the items of the current page are
+    being consumed, so at most two pages are held in memory at any time.
+    Raises requests.HTTPError if a page can't be retrieved, rather than ending the list early.
+    """
+
+    def get_page(page):
+        return session.get(
+            url,
+            headers=headers,
+            params={**params, "page": page, "size": page_size},
+            verify=verify,
+        )
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = 0
+        next_page = executor.submit(get_page, page)
+        while next_page is not None:
+            response = next_page.result()
+            if response.status_code != 200:
+                raise requests.HTTPError(
+                    f"Unable to retrieve page {page}: status {response.status_code}, {response.text}",
+                    response=response,
+                )
+            items = response.json()["array"]
+            page += 1
+            next_page = None
+            if page == 1:
+                # The server may cap the page size, so a full page is as long as the first one
+                full_page = len(items)
+            if items and len(items) >= full_page:
+                next_page = executor.submit(get_page, page)
+            yield from items
 
 
 if __name__ == "__main__":
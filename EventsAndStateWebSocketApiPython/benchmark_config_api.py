@@ -0,0 +1,134 @@
+"""
+Benchmark of resolving the names of new sources on a cold start, with a new connection per
+lookup compared with the shared session opened by config_api.open_session(), and of a burst of
+events from a few sources resolved all at once
+
+Run it with e.g. "python benchmark_config_api.py --ids 1000". It starts a local HTTPS server
+answering like the Configuration REST API, using a self-signed certificate generated with the
+cryptography package, or plain HTTP if that isn't installed or --no-tls is given.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import ssl
+import tempfile
+import time
+import uuid
+from aiohttp import web
+import config_api
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+
+def create_ssl_context():
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+
+    directory = tempfile.mkdtemp()
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+async def start_server(latency, tls):
+    # The transport of each request; kept, so the connections can be told apart afterwards
+    transports = []
+
+    async def get_item(request):
+        transports.append(request.transport)
+        if latency:
+            await asyncio.sleep(latency)
+        item_id = request.match_info["id"]
+        body = {"data": {"id": item_id, "displayName": f"Camera {item_id[:8]}"}}
+        return web.Response(text=json.dumps(body), content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/api/rest/v1/{resource}/{id}", get_item)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    ssl_context = create_ssl_context() if tls else None
+    site = web.TCPSite(runner, "127.0.0.1", 0, ssl_context=ssl_context)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    scheme = "https" if tls else "http"
+    return runner, f"{scheme}://127.0.0.1:{port}", transports
+
+
+async def resolve(gateway_uri, source_ids, concurrency):
+    config_api.config_cache.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve_one(source_id):
+        async with semaphore:
+            return await config_api.get_source_name(f"cameras/{source_id}", gateway_uri, "token")
+
+    start = time.perf_counter()
+    names = await asyncio.gather(*[resolve_one(source_id) for source_id in source_ids])
+    elapsed = time.perf_counter() - start
+    unknown = sum(1 for name in names if name == "Unknown")
+    return elapsed, unknown
+
+
+async def run(ids, concurrency, latency, tls):
+    runner, gateway_uri, transports = await start_server(latency, tls)
+    config_api.verify_ssl = False
+    source_ids = [str(uuid.uuid4()) for _ in range(ids)]
+    # The same number of lookups, for only 10 sources, all in flight at once
+    burst_ids = [source_ids[i % 10] for i in range(ids)]
+    print(f"Resolving {ids} ids against {gateway_uri}")
+    print(f"{'':<24} {'seconds':>9} {'ms/id':>9} {'requests':>9} {'connections':>12} {'unknown':>8}")
+    try:
+        for label, shared, lookup_ids, in_flight in (
+            ("connection per lookup", False, source_ids, concurrency),
+            ("shared session", True, source_ids, concurrency),
+            ("burst from 10 sources", True, burst_ids, ids),
+        ):
+            transports.clear()
+            if shared:
+                await config_api.open_session(limit=concurrency)
+            try:
+                elapsed, unknown = await resolve(gateway_uri, lookup_ids, in_flight)
+            finally:
+                await config_api.close_session()
+            print(f"{label:<24} {elapsed:>9.2f} {elapsed * 1000 / ids:>9.2f} {len(transports):>9} {len(set(map(id, transports))):>12} {unknown:>8}")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of config_api lookups on a cold start")
+    parser.add_argument("--ids", type=int, default=1000, help="number of ids to resolve")
+    parser.add_argument("--concurrency", type=int, default=1, help="lookups in flight; the viewers resolve one at a time")
+    parser.add_argument("--latency", type=float, default=0.0, help="server latency in seconds")
+    parser.add_argument("--no-tls", action="store_true", help="use plain HTTP")
+    args = parser.parse_args()
+
+    tls = not args.no_tls and x509 is not None
+    asyncio.run(run(args.ids, args.concurrency, args.latency, tls))
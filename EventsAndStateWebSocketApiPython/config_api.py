@@ -4,10 +4,35 @@ Results are cached to provide better performance and prevent putting a high load
 """
 
 import aiohttp
+import asyncio
 import json
+import time
+import weakref
+from config_cache import ConfigCache
+from http2_transport import AsyncHttp2Session
+from instrumentation import RequestRecord
 
-config_cache = {}
+# Names keyed by resource path and data key, e.g. ("eventTypes/<id>", "state")
+config_cache = ConfigCache()
+# Requests in progress, keyed by resource path
+_in_flight = {}
+# Requests in progress when their item was invalidated, whose names are not cached
+_invalidated_fetches = weakref.WeakSet()
+# The paths invalidated while a page of prefetch() was requested, one set per prefetch in progress
+_prefetch_invalidations = []
+# The data keys prefetched per resource type; displayName for the types not listed
+_lookup_keys = {"eventTypes": ("displayName", "state")}
 verify_ssl = True
+# Set to True to multiplex all lookups over a single HTTP/2 connection (requires httpx[http2]).
+# Applies to the session opened by open_session(); lookups without one use HTTP/1.1
+use_http2 = False
+# Optional instrumentation.Instrumentation recording every request sent by lookup
+instrumentation = None
+# Optional name_store.NameStore keeping the names across restarts
+name_store = None
+# Optional token_manager.TokenManager providing the token of every lookup, in place of the
+# access_token passed to it
+token_manager = None
 
 
 async def get_source_name(resource_path, gateway_uri, access_token):
@@ -31,24 +56,218 @@ async def get_state_group_name(state_group_id, gateway_uri, access_token):
 
 
 async def lookup(resource_path, data_key, gateway_uri, access_token):
-    if resource_path in config_cache:
-        return config_cache[resource_path]
+    name = config_cache.get((resource_path, data_key))
+    if name is not None:
+        return name
+    return await _resolve(resource_path, data_key, gateway_uri, access_token)
+
+
+async def _resolve(resource_path, data_key, gateway_uri, access_token, keep_on_error=False):
+    # Concurrent lookups of the same item, e.g. a burst of events from one camera, share a
+    # single request. Shielded, so a cancelled caller doesn't cancel it for the others.
+    future = _in_flight.get(resource_path)
+    if future is None:
+        future = asyncio.ensure_future(_fetch(resource_path, gateway_uri, access_token))
+        _in_flight[resource_path] = future
+        future.add_done_callback(lambda done: _in_flight.pop(resource_path) if _in_flight.get(resource_path) is done else None)
+    status, data = await asyncio.shield(future)
 
     name = "Unknown"
+    if future in _invalidated_fetches:
+        # The item changed while it was looked up, so the name may be outdated. It is displayed
+        # once, but not cached, and the next lookup reads the item again
+        if status == 200:
+            name = data['data'].get(data_key, name)
+    elif status == 200:
+        name = data['data'].get(data_key, name)
+        config_cache.put((resource_path, data_key), name)
+        if name_store is not None:
+            name_store.put([(resource_path, data_key, name)])
+    elif keep_on_error and (status is None or status >= 500):
+        # The stored name is kept until the API Gateway can be reached
+        return name
+    else:
+        # Cache "Unknown" for a while, so a failing id isn't looked up on every event
+        config_cache.put_negative((resource_path, data_key), name)
+        if name_store is not None and status == 404:
+            name_store.remove(resource_path, data_key)
+
+    return name
+
+
+def restore_names():
+    """
+    Fills config_cache with the names in name_store, and returns the number of names restored.
+    """
+    if name_store is None:
+        return 0
+    entries = name_store.load()
+    for resource_path, data_key, name in entries:
+        config_cache.put((resource_path, data_key), name)
+    return len(entries)
+
+
+async def revalidate(gateway_uri, access_token, before, concurrency=8):
+    """
+    Looks up the names in name_store that were last looked up before the given time.time() again,
+    concurrency at a time, e.g. the names restored at startup that prefetch() didn't refresh.
+    A name is replaced when it has changed and removed when the item no longer exists.
+    Returns the number of names looked up.
+    """
+    if name_store is None:
+        return 0
+    stale = name_store.stale(before)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def refresh(resource_path, data_key):
+        async with semaphore:
+            await _resolve(resource_path, data_key, gateway_uri, access_token, keep_on_error=True)
+
+    await asyncio.gather(*[refresh(resource_path, data_key) for resource_path, data_key in stale])
+    return len(stale)
+
+
+async def prefetch(resource_types, gateway_uri, access_token, page_size=500):
+    """
+    Fills config_cache with the names of all items of the given resource types, e.g. eventTypes,
+    stateGroups and cameras, reading them one page of items at a time. The first events are then
+    displayed without looking up their ids one by one. Returns the number of items read.
+    Prints a warning when config_cache is too small to hold all the names read.
+    """
+    resource_types = list(resource_types)
+    counts = await asyncio.gather(*[_prefetch_type(resource_type, gateway_uri, access_token, page_size) for resource_type in resource_types])
+    names = sum(count * len(_lookup_keys.get(resource_type, ("displayName",))) for resource_type, count in zip(resource_types, counts))
+    if names > config_cache.max_entries:
+        print(f"[!] Read {names} names, but config_cache holds at most {config_cache.max_entries}, so the others are looked up again. "
+              f"Set config_api.config_cache = ConfigCache(max_entries={names}) or more to keep them all")
+    return sum(counts)
+
+
+async def _prefetch_type(resource_type, gateway_uri, access_token, page_size):
+    data_keys = _lookup_keys.get(resource_type, ("displayName",))
+    count = 0
+    invalidated = set()
+    _prefetch_invalidations.append(invalidated)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{gateway_uri}/api/rest/v1/{resource_path}", headers={"Authorization": f"Bearer {access_token}"}, verify_ssl=verify_ssl) as response:
-                data = await response.text()
+        async for items in _pages(resource_type, gateway_uri, access_token, page_size):
+            # Items invalidated while the page was requested are left to be looked up again
+            entries = [(f"{resource_type}/{item['id']}", data_key, item.get(data_key, "Unknown")) for item in items for data_key in data_keys
+                       if f"{resource_type}/{item['id']}" not in invalidated]
+            invalidated.clear()
+            for resource_path, data_key, name in entries:
+                config_cache.put((resource_path, data_key), name)
+            if name_store is not None:
+                name_store.put(entries)
+            count += len(items)
+    finally:
+        _prefetch_invalidations[:] = [s for s in _prefetch_invalidations if s is not invalidated]
+    return count
 
-                if response.status == 200:
-                    data = json.loads(data)
-                    name = data['data'][data_key]
-                    config_cache[resource_path] = name
-                elif 400 <= response.status <= 499:
-                    # Bad request - cache "Unknown", so we don't retry
-                    config_cache[resource_path] = name
 
-    except:
-        pass
+async def find_event_types(display_names, gateway_uri, access_token):
+    """
+    Returns the ids of the event types with one of the given display names, ignoring case.
+    """
+    wanted = {name.lower() for name in display_names}
+    ids = []
+    async for items in _pages("eventTypes", gateway_uri, access_token, 500):
+        ids.extend(item['id'] for item in items if item.get("displayName", "").lower() in wanted)
+    return ids
 
-    return name
+
+def invalidate(resource_path):
+    """
+    Removes the cached and stored names of an item, e.g. when it has been changed, so they are
+    looked up again the next time they are needed. A lookup or prefetch of the item in progress
+    doesn't cache the name it reads, as it may have been read before the change.
+    """
+    future = _in_flight.pop(resource_path, None)
+    if future is not None:
+        _invalidated_fetches.add(future)
+    for invalidated in _prefetch_invalidations:
+        invalidated.add(resource_path)
+    for data_key in _lookup_keys.get(resource_path.split("/")[0], ("displayName",)):
+        config_cache.remove((resource_path, data_key))
+        if name_store is not None:
+            name_store.remove(resource_path, data_key)
+
+
+async def _pages(resource_type, gateway_uri, access_token, page_size):
+    page = 0
+    while True:
+        status, data = await _fetch(f"{resource_type}?page={page}&size={page_size}", gateway_uri, access_token)
+        if status != 200:
+            print(f"[!] Unable to read page {page} of {resource_type}: {'status ' + str(status) if status is not None else 'no response'}")
+            return
+        items = data['array']
+        yield items
+        if page == 0:
+            # The server may cap the page size, so a full page is as long as the first one
+            full_page = len(items)
+        if not items or len(items) < full_page:
+            return
+        page += 1
+
+
+async def _fetch(resource_path, gateway_uri, access_token):
+    if token_manager is not None:
+        access_token = await token_manager.get_token_async()
+    resource_plural = resource_path.split("/")[0].split("?")[0]
+    if instrumentation is not None:
+        instrumentation.started("GET", resource_plural)
+    start = time.perf_counter()
+    status, data, response_bytes, error = None, None, 0, None
+    try:
+        status, data = await _get(f"{gateway_uri}/api/rest/v1/{resource_path}", {"Authorization": f"Bearer {access_token}"})
+        if status == 401 and token_manager is not None:
+            # The token was revoked or expired early, so renew it and try once more
+            access_token = await token_manager.renew_async(access_token)
+            status, data = await _get(f"{gateway_uri}/api/rest/v1/{resource_path}", {"Authorization": f"Bearer {access_token}"})
+        response_bytes = len(data.encode())
+        data = json.loads(data) if status == 200 else None
+
+    except Exception as err:
+        status, data, error = None, None, err
+
+    if instrumentation is not None:
+        instrumentation.completed(RequestRecord("GET", resource_plural, status, time.perf_counter() - start, 0, response_bytes, error=error))
+
+    return status, data
+
+
+# Session shared by all lookups between open_session() and close_session()
+_session = None
+
+
+async def open_session(limit=32, keepalive_timeout=60):
+    """
+    Opens a session shared by all lookups, keeping up to limit connections to the API Gateway
+    open for keepalive_timeout seconds after their last use. Without it, each lookup opens a
+    new connection, including a TLS handshake. Call close_session() before the event loop ends.
+    """
+    global _session
+
+    await close_session()
+    if use_http2:
+        _session = AsyncHttp2Session(verify=verify_ssl, max_connections=limit)
+    else:
+        connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit, keepalive_timeout=keepalive_timeout, ttl_dns_cache=300, ssl=verify_ssl)
+        _session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+
+
+async def close_session():
+    global _session
+
+    if _session is not None:
+        session, _session = _session, None
+        await session.close()
+
+
+async def _get(url, headers):
+    if _session is not None:
+        async with _session.get(url, headers=headers) as response:
+            return response.status, await response.text()
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, headers=headers, verify_ssl=verify_ssl) as response:
+            return response.status, await response.text()
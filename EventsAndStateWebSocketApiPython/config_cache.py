@@ -0,0 +1,73 @@
+"""
+Bounded cache of the names looked up by config_api, expiring entries so renamed items are
+picked up without a restart.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class ConfigCache:
+    """
+    Holds up to max_entries names, evicting the least recently used one when full.
+    A name is kept for ttl seconds. A failed lookup is remembered for negative_ttl seconds, so
+    an id that keeps failing is retried now and then instead of on every event.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, negative_ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Returns the cached name, or None if it isn't cached or has expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.__put(key, value, self.ttl)
+
+    def put_negative(self, key, value="Unknown"):
+        """Caches the result of a failed lookup for negative_ttl seconds"""
+        self.__put(key, value, self.negative_ttl)
+
+    def remove(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __put(self, key, value, ttl):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
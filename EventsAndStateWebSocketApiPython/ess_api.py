@@ -2,12 +2,109 @@
 Provide access to the Events and State web socket API.
 """
 
+import asyncio
 import json
 
-command_id = 0
 
+class EssConnection:
+    """ A connection to the Events and State API, reading the web socket from a single background task.
 
-async def start_session(web_socket, session_id, event_id):
+    Command responses are matched to the commands by commandId, so several commands can be in flight at once,
+    and events received in the meantime are queued instead of discarded.
+
+    Up to max_queued messages with events are queued. When the queue is full, the reader stops reading the web socket
+    until receive_events() makes room, so a burst of events is held back by the server instead of filling memory.
+    Command responses are not read meanwhile either, so keep receiving events while waiting for a command.
+
+    Use it as an async context manager wrapping an open web socket:
+
+    async with connect(uri, additional_headers=headers) as web_socket, EssConnection(web_socket) as connection:
+        session = await start_session(connection, "", "")
+    """
+
+    def __init__(self, web_socket, max_queued=100):
+        self.web_socket = web_socket
+        self.events = asyncio.Queue(max_queued)
+        self._command_id = 0
+        self._pending = {}
+        self._reader = None
+        self._error = None
+
+    async def __aenter__(self):
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def __aexit__(self, *args):
+        self._reader.cancel()
+        try:
+            await self._reader
+        except asyncio.CancelledError:
+            pass
+
+    async def send_command(self, command):
+        """ Send a command and wait for its response. Raises an exception if the status does not indicate success. """
+        if self._reader is not None and self._reader.done():
+            # No response will ever be read, so fail right away with the error that stopped the reader
+            raise self._error or Exception("Connection closed")
+        self._command_id += 1
+        command_id = self._command_id
+        command["commandId"] = command_id
+        response_future = asyncio.get_running_loop().create_future()
+        self._pending[command_id] = response_future
+
+        try:
+            await self.web_socket.send(json.dumps(command))
+            response = await response_future
+        finally:
+            self._pending.pop(command_id, None)
+
+        # Raise an exception with errorText if the status does not indicate success
+        if not 200 <= response["status"] <= 299:
+            raise Exception(f"Command failed. {response['status']}: {response['error']['errorText']}")
+
+        return response
+
+    async def receive_events(self):
+        """ Wait for the next message with events, raising the error that stopped the reader, if any. """
+        if self.events.empty() and self._reader is not None and self._reader.done():
+            raise self._error or Exception("Connection closed")
+        events = await self.events.get()
+        if isinstance(events, Exception):
+            raise events
+        return events
+
+    async def _read(self):
+        error = None
+        try:
+            async for msg in self.web_socket:
+                message = json.loads(msg)
+                if "commandId" in message:
+                    response_future = self._pending.get(message["commandId"])
+                    if response_future is not None and not response_future.done():
+                        response_future.set_result(message)
+                elif "events" in message:
+                    # Waits while the queue is full, leaving further messages unread in the web socket
+                    await self.events.put(message)
+                else:
+                    raise Exception(f"Unexpected message received: {msg}")
+            error = Exception("Connection closed")
+        except asyncio.CancelledError:
+            error = Exception("Connection closed")
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self._error = error
+            # Wake up everyone waiting on this connection
+            for response_future in self._pending.values():
+                if not response_future.done():
+                    response_future.set_exception(error)
+            # A receiver waiting for events is woken up; otherwise it finds the error once the queue is drained
+            if not self.events.full():
+                self.events.put_nowait(error)
+
+
+async def start_session(connection, session_id, event_id):
     """ Start a session.
     
     session_id and event_id may be left blank to start a new session.
@@ -20,14 +117,14 @@ async def start_session(web_socket, session_id, event_id):
     - 200 indicates an existing session was successfully resumed.
     - 201 indicates a new session was created.
     """
-    return await send_command(web_socket, {
+    return await connection.send_command({
         "command": "startSession",
         "sessionId": session_id,
         "eventId": event_id
     })
 
 
-async def create_subscription(web_socket, filters):
+async def create_subscription(connection, filters):
     """ Create a subscription.
     
     filters must be in the format:
@@ -49,54 +146,26 @@ async def create_subscription(web_socket, filters):
     response["status"] will contain the status - 200 indicates subscription was successfully created.
     response["subscriptionId"] will contain an id used to unsubscribe.
     """
-    return await send_command(web_socket, {
+    return await connection.send_command({
         "command": "addSubscription",
         "filters": filters
     })
 
 
-async def get_state(web_socket):
+async def get_state(connection):
     """ Get state based on current subscriptions.
     
     response["status"] will contain the status - 200 indicates success.
     response["states"] will contain a list of states / statuful events.
     """
-    return await send_command(web_socket, {
+    return await connection.send_command({
         "command": "getState",
     })
 
 
-async def receive_events(web_socket):
+async def receive_events(connection):
     """ Wait for events to be received.
     
     response["events"] will contain a list of events.
     """
-    msg = await web_socket.recv()
-    events = json.loads(msg)
-
-    if "events" not in events:
-        raise Exception(f"Unexpected message received: {msg}")
-
-    return events
-
-
-async def send_command(web_socket, command):
-    global command_id
-    command_id += 1
-    command["commandId"] = command_id
-
-    await web_socket.send(json.dumps(command))
-
-    # Read from the websocket until we get a command response (discarding any other messages - e.g. events)
-    response = {}
-    while "commandId" not in response or response["commandId"] != command_id:
-        msg = await web_socket.recv()
-        response = json.loads(msg)
-
-    # Raise an exception with errorText if the status does not indicate success
-    if not 200 <= response["status"] <= 299:
-        raise Exception(f"Command failed. {response['status']}: {response['error']['errorText']}")
-
-    return response
-
-
+    return await connection.receive_events()
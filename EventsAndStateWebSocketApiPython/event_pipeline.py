@@ -0,0 +1,158 @@
+"""
+Bounded queue of event batches between receiving events and processing them, so slow
+processing, e.g. looking up names, doesn't hold up receiving.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+SPILL = "spill"
+
+
+class EventPipeline:
+    """
+    Queues up to max_size batches of events, processed by a number of worker tasks calling
+    process(events). When the queue is full, the overflow policy decides what happens:
+
+    - "block": put() waits until a worker has taken a batch
+    - "drop-oldest": the oldest queued batch is dropped to make room
+    - "spill": batches are appended to a file, and read back in order when there is room again
+
+    With more than one worker, batches may be processed out of order.
+    """
+
+    def __init__(self, process, workers=1, max_size=1000, overflow=BLOCK, spill_path=None):
+        if overflow not in (BLOCK, DROP_OLDEST, SPILL):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.process = process
+        self.workers = workers
+        self.overflow = overflow
+        self._queue = asyncio.Queue(max_size)
+        self._tasks = []
+        self._spill_path = spill_path
+        self._spill_file = None
+        self._spill_offset = 0
+        self._spilled_pending = 0
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.max_depth = 0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    async def stop(self):
+        """ Stops the workers, discarding the batches not processed yet """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._spill_file is not None:
+            self._spill_file.close()
+            os.remove(self._spill_file.name)
+            self._spill_file = None
+            self._spilled_pending = 0
+
+    async def put(self, events):
+        """ Queues a batch of events, applying the overflow policy if the queue is full """
+        self.received += len(events)
+        item = (time.monotonic(), events)
+
+        if self._spilled_pending > 0:
+            # Keep the order: once batches are on disk, new ones go after them
+            self.__spill(item)
+        elif not self._queue.full():
+            self._queue.put_nowait(item)
+        elif self.overflow == BLOCK:
+            await self._queue.put(item)
+        elif self.overflow == DROP_OLDEST:
+            _, oldest = self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += len(oldest)
+            self._queue.put_nowait(item)
+        else:
+            self.__spill(item)
+
+        self.max_depth = max(self.max_depth, self.depth())
+
+    async def join(self):
+        """ Waits until all queued batches, including spilled ones, have been processed """
+        while self._spilled_pending > 0 or not self._queue.empty():
+            await self._queue.join()
+
+    def depth(self):
+        """ The number of batches waiting, including spilled ones """
+        return self._queue.qsize() + self._spilled_pending
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "maxDepth": self.max_depth,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "averageLag": self._total_lag / self.processed if self.processed else 0.0,
+            "maxLag": self.max_lag,
+        }
+
+    async def _work(self):
+        while True:
+            queued_at, events = await self._queue.get()
+            self.__unspill()
+            lag = time.monotonic() - queued_at
+            self.max_lag = max(self.max_lag, lag)
+            try:
+                await self.process(events)
+                self.processed += len(events)
+                self._total_lag += lag * len(events)
+            except Exception as e:
+                self.failed += len(events)
+                print(f"[!] Processing events failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def __spill(self, item):
+        if self._spill_file is None:
+            if self._spill_path is None:
+                fd, self._spill_path = tempfile.mkstemp(prefix="events-", suffix=".jsonl")
+                os.close(fd)
+            self._spill_file = open(self._spill_path, "w+b")
+            self._spill_offset = 0
+        queued_at, events = item
+        self._spill_file.seek(0, os.SEEK_END)
+        self._spill_file.write(json.dumps([queued_at, events]).encode() + b"\n")
+        self._spilled_pending += 1
+        self.spilled += len(events)
+
+    def __unspill(self):
+        # Move spilled batches back to the queue as room becomes available, oldest first
+        while self._spilled_pending > 0 and not self._queue.full():
+            self._spill_file.seek(self._spill_offset)
+            line = self._spill_file.readline()
+            self._spill_offset = self._spill_file.tell()
+            queued_at, events = json.loads(line)
+            self._queue.put_nowait((queued_at, events))
+            self._spilled_pending -= 1
+        if self._spill_file is not None and self._spilled_pending == 0 and self._spill_offset > 0:
+            self._spill_file.seek(0)
+            self._spill_file.truncate()
+            self._spill_offset = 0
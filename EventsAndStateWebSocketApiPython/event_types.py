@@ -22,3 +22,7 @@ communication_hw_error = "6baad64b-c395-4f52-b6a3-dd1b64aa2f0f"
 
 output_activated = "7a78f5bb-d8c3-4997-89b7-cae72713b7db"
 output_deactivated = "35742498-bcc5-4f0a-9800-827c9388d1cd"
+
+# Display names of the event types fired when the configuration of an item changes.
+# Their ids are looked up in the REST API at startup, see config_api.find_event_types()
+configuration_changed = ["Configuration changed", "Item configuration changed"]
@@ -9,7 +9,7 @@ import config_api
 
 def display_header():
     os.system("cls")
-    print("Press ESC to return to menu")
+    print("Press ESC to return to menu, S to show queue statistics")
     print("=" * 100)
     print("Timestamp".ljust(30), "Source".ljust(50), "Event".ljust(30))
     print("=" * 100)
@@ -0,0 +1,247 @@
+"""
+HTTP/2 sessions used in place of requests and aiohttp sessions.
+
+Concurrent requests are multiplexed as streams over a single TLS connection to the API Gateway,
+instead of holding one HTTP/1.1 connection per request in flight. Requires the httpx package
+with HTTP/2 support:
+
+    pip install httpx[http2]
+"""
+import asyncio
+import json
+import aiohttp
+import requests
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def _check_httpx():
+    if httpx is None:
+        raise ImportError(
+            "HTTP/2 support requires the httpx package: pip install httpx[http2]"
+        )
+
+
+def _url_with_params(url: str, params) -> str:
+    # The query string may be passed preformatted, e.g. 'param1=value1&param2'
+    if not params:
+        return url
+    if isinstance(params, dict):
+        params = "&".join([k if v is None else f"{k}={v}" for k, v in params.items()])
+    return f"{url}&{params}" if "?" in url else f"{url}?{params}"
+
+
+class Http2Session:
+    """
+    Class sending requests over HTTP/2, used in place of a requests.Session.
+
+    Only the request() method of requests.Session is provided, and it returns requests.Response
+    objects. Authentication handlers like HttpNtlmAuth are not supported, so use a
+    requests.Session to get a token for a Windows user.
+
+    The session is thread-safe, so requests sent from several threads share one connection.
+    """
+
+    def __init__(
+        self, verify=False, timeout: float = 30.0, max_connections: int = 10
+    ):
+        """Constructor
+
+        :param verify: Whether to verify the certificate of the API Gateway, or the path of a
+            CA bundle. Unlike requests, this is set once for the session.
+        :param timeout: Seconds to wait for connecting, reading and writing
+        :param max_connections: The maximum number of connections per host. Over HTTP/2, a
+            single connection carries as many concurrent requests as the server allows
+            streams; more are only opened if the server falls back to HTTP/1.1.
+        """
+        _check_httpx()
+        self._client = httpx.Client(
+            http2=True,
+            verify=verify,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict = None,
+        params=None,
+        data=None,
+        **kwargs,
+    ) -> requests.Response:
+        """Sends a request, mapping httpx errors to the matching requests exceptions.
+
+        Other keyword arguments of requests.Session.request(), like verify, are ignored.
+        """
+        url = _url_with_params(url, params)
+        try:
+            res = self._client.request(method, url, headers=headers, content=data)
+        except httpx.TimeoutException as err:
+            raise requests.exceptions.Timeout(str(err)) from err
+        except httpx.TransportError as err:
+            raise requests.exceptions.ConnectionError(str(err)) from err
+        except httpx.HTTPError as err:
+            raise requests.exceptions.RequestException(str(err)) from err
+
+        response = requests.Response()
+        response.status_code = res.status_code
+        response.reason = res.reason_phrase
+        response.headers = requests.structures.CaseInsensitiveDict(res.headers)
+        response.url = str(res.url)
+        response.encoding = res.encoding
+        response.elapsed = res.elapsed
+        response._content = res.content
+        response.request = requests.Request(
+            method, url, headers=headers, data=data
+        ).prepare()
+        response.http_version = res.http_version
+        return response
+
+    def close(self):
+        """Closes the connections."""
+        self._client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Http2Response:
+    """
+    Class holding a response received over HTTP/2, with the most used members of
+    aiohttp.ClientResponse. The body has already been read.
+    """
+
+    def __init__(self, method: str, res):
+        self.method = method
+        self.url = URL(str(res.url))
+        self.status = res.status_code
+        self.reason = res.reason_phrase
+        self.headers = CIMultiDictProxy(CIMultiDict(res.headers.multi_items()))
+        self.http_version = res.http_version
+        self._body = res.content
+        self._encoding = res.encoding
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: str = None) -> str:
+        return self._body.decode(encoding or self._encoding or "utf-8")
+
+    async def json(self, **kwargs):
+        # Like aiohttp, an empty body, e.g. of a 204 response, is returned as None
+        if not self._body.strip():
+            return None
+        return json.loads(self._body)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(
+                aiohttp.RequestInfo(self.url, self.method, self.headers, self.url),
+                (),
+                status=self.status,
+                message=self.reason,
+                headers=self.headers,
+            )
+
+    def release(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class _RequestContext:
+    def __init__(self, coro):
+        self._coro = coro
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self) -> Http2Response:
+        return await self._coro
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class AsyncHttp2Session:
+    """
+    Class sending requests over HTTP/2, used in place of an aiohttp.ClientSession.
+
+    Only the request() and get() methods of aiohttp.ClientSession are provided. They can be
+    used as async context managers, and they return Http2Response objects.
+    """
+
+    def __init__(
+        self, verify=False, timeout: float = 30.0, max_connections: int = 100
+    ):
+        """Constructor
+
+        :param verify: Whether to verify the certificate of the API Gateway, or an
+            ssl.SSLContext
+        :param timeout: Seconds to wait for connecting, reading and writing
+        :param max_connections: The maximum number of connections per host. Over HTTP/2, a
+            single connection carries as many concurrent requests as the server allows
+            streams; more are only opened if the server falls back to HTTP/1.1.
+        """
+        _check_httpx()
+        self._client = httpx.AsyncClient(
+            http2=True,
+            verify=verify,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict = None,
+        params=None,
+        data=None,
+        **kwargs,
+    ) -> _RequestContext:
+        """Sends a request, mapping httpx errors to the matching aiohttp exceptions.
+
+        Other keyword arguments of aiohttp.ClientSession.request() are ignored.
+        """
+        return _RequestContext(self.__request(method, url, headers, params, data))
+
+    def get(self, url: str, **kwargs) -> _RequestContext:
+        """Sends a GET request, like aiohttp.ClientSession.get()."""
+        return self.request("GET", url, **kwargs)
+
+    async def __request(self, method, url, headers, params, data) -> Http2Response:
+        url = _url_with_params(url, params)
+        try:
+            res = await self._client.request(method, url, headers=headers, content=data)
+        except httpx.TimeoutException as err:
+            raise asyncio.TimeoutError(str(err)) from err
+        except httpx.TransportError as err:
+            raise aiohttp.ClientConnectionError(str(err)) from err
+        except httpx.HTTPError as err:
+            raise aiohttp.ClientError(str(err)) from err
+        return Http2Response(method, res)
+
+    async def close(self):
+        """Closes the connections."""
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
@@ -1,8 +1,10 @@
 """
 Get a bearer access token from the identity provider
 """
+import time
 import requests
 from requests_ntlm import HttpNtlmAuth
+from instrumentation import Instrumentation, RequestRecord
 
 
 def get_token(
@@ -11,7 +13,8 @@ def get_token(
     password: str,
     serverUrl: str,
     isBasicUser: bool,
-    verify: bool
+    verify: bool,
+    instrumentation: Instrumentation = None,
 ) -> str:
     """
     Requests an OAuth 2.0 access token from the identity provider on a VMS server for a VMS user.
@@ -23,6 +26,7 @@ def get_token(
     :param password: The password of the user logging in
     :param server: The hostname of the machine hosting the identity provider, e.g. "vms.example.com"
     :param isBasicUser: Defines whether the login should be done using basic authentication
+    :param instrumentation: Optional Instrumentation recording the request as resource "token"
 
     :returns: session.Response object. The value of the 'access_token' property is the bearer token.
 
@@ -30,9 +34,28 @@ def get_token(
         have to renew before it has elapsed.
     """
 
-    if isBasicUser:
-        return get_token_basic(session, username, password, serverUrl, verify)
-    return get_token_windows(session, username, password, serverUrl, verify)
+    if instrumentation is not None:
+        instrumentation.started("POST", "token")
+    start = time.perf_counter()
+    response = None
+    try:
+        if isBasicUser:
+            response = get_token_basic(session, username, password, serverUrl, verify)
+        else:
+            response = get_token_windows(session, username, password, serverUrl, verify)
+        return response
+    finally:
+        if instrumentation is not None:
+            instrumentation.completed(
+                RequestRecord(
+                    "POST",
+                    "token",
+                    response.status_code if response is not None else None,
+                    time.perf_counter() - start,
+                    len(response.request.body or "") if response is not None else 0,
+                    len(response.content) if response is not None else 0,
+                )
+            )
 
 
 def get_token_basic(
@@ -0,0 +1,202 @@
+"""
+Instrumentation of REST calls: hooks, latency histograms, and Prometheus text or JSON dumps.
+"""
+import json
+import threading
+from typing import Callable, List
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestRecord:
+    """
+    Class representing a completed (or failed) request.
+    """
+
+    def __init__(
+        self,
+        verb: str,
+        resource_plural: str,
+        status: int,
+        latency: float,
+        request_bytes: int,
+        response_bytes: int,
+        retries: int = 0,
+        error: Exception = None,
+    ):
+        """Constructor
+
+        :param verb: Request method
+        :param resource_plural: The resource type of the request, e.g. cameras, or "token"
+            for identity provider requests
+        :param status: The status code of the response, or None if no response was received
+        :param latency: Seconds from sending the request until the response was read,
+            including retries
+        :param request_bytes: Size of the request body
+        :param response_bytes: Size of the response body
+        :param retries: The number of retries made
+        :param error: The exception raised, if the request failed
+        """
+        self.verb = verb
+        self.resource_plural = resource_plural
+        self.status = status
+        self.latency = latency
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.retries = retries
+        self.error = error
+
+
+class LatencyHistogram:
+    """
+    Class counting latencies in cumulative buckets, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile as the upper bound of the bucket it falls in.
+
+        :returns: Seconds, or None if no value was observed or it exceeds the last bucket
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return bound
+        return None
+
+
+class _Metrics:
+    def __init__(self, buckets: tuple):
+        self.latency = LatencyHistogram(buckets)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+        self.errors = 0
+
+
+class Instrumentation:
+    """
+    Class collecting metrics of REST calls per resource type and method, and calling hooks
+    before and after each call.
+
+    Pre hooks are called with the verb and resource type when a call starts. Post hooks are
+    called with a RequestRecord when it has completed or failed.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """Constructor
+
+        :param buckets: Upper bounds in seconds of the latency histogram buckets
+        """
+        self._buckets = buckets
+        self._metrics = {}
+        self._pre_hooks = []
+        self._post_hooks = []
+        self._lock = threading.Lock()
+
+    def add_pre_hook(self, hook: Callable[[str, str], None]):
+        """Adds a function called with the verb and resource type when a call starts."""
+        self._pre_hooks.append(hook)
+
+    def add_post_hook(self, hook: Callable[[RequestRecord], None]):
+        """Adds a function called with a RequestRecord when a call has completed or failed."""
+        self._post_hooks.append(hook)
+
+    def started(self, verb: str, resource_plural: str):
+        """Reports that a call has started."""
+        for hook in self._pre_hooks:
+            hook(verb, resource_plural)
+
+    def completed(self, record: RequestRecord):
+        """Reports that a call has completed or failed."""
+        with self._lock:
+            key = (record.resource_plural, record.verb)
+            if key not in self._metrics:
+                self._metrics[key] = _Metrics(self._buckets)
+            metrics = self._metrics[key]
+            metrics.latency.observe(record.latency)
+            metrics.request_bytes += record.request_bytes
+            metrics.response_bytes += record.response_bytes
+            metrics.retries += record.retries
+            if record.status is None or record.status >= 400:
+                metrics.errors += 1
+        for hook in self._post_hooks:
+            hook(record)
+
+    def reset(self):
+        """Removes all collected metrics."""
+        with self._lock:
+            self._metrics = {}
+
+    def to_dict(self) -> List[dict]:
+        """Returns the collected metrics, one dict per resource type and method."""
+        with self._lock:
+            return [
+                {
+                    "resource": resource_plural,
+                    "verb": verb,
+                    "count": m.latency.count,
+                    "errors": m.errors,
+                    "retries": m.retries,
+                    "latencySum": m.latency.sum,
+                    "latencyP50": m.latency.quantile(0.5),
+                    "latencyP99": m.latency.quantile(0.99),
+                    "requestBytes": m.request_bytes,
+                    "responseBytes": m.response_bytes,
+                }
+                for (resource_plural, verb), m in sorted(self._metrics.items())
+            ]
+
+    def to_json(self) -> str:
+        """Returns the collected metrics as JSON, sorted by total latency, highest first."""
+        metrics = sorted(self.to_dict(), key=lambda m: m["latencySum"], reverse=True)
+        return json.dumps(metrics, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Returns the collected metrics in the Prometheus text exposition format."""
+        lines = [
+            "# TYPE rest_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted(self._metrics.items())
+            for (resource_plural, verb), m in items:
+                labels = f'resource="{resource_plural}",verb="{verb}"'
+                for bound, count in zip(m.latency.buckets, m.latency.counts):
+                    lines.append(
+                        f'rest_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'rest_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m.latency.count}'
+                )
+                lines.append(
+                    f"rest_request_duration_seconds_sum{{{labels}}} {m.latency.sum}"
+                )
+                lines.append(
+                    f"rest_request_duration_seconds_count{{{labels}}} {m.latency.count}"
+                )
+            for name, attribute in (
+                ("rest_request_bytes_total", "request_bytes"),
+                ("rest_response_bytes_total", "response_bytes"),
+                ("rest_retries_total", "retries"),
+                ("rest_errors_total", "errors"),
+            ):
+                lines.append(f"# TYPE {name} counter")
+                for (resource_plural, verb), m in items:
+                    labels = f'resource="{resource_plural}",verb="{verb}"'
+                    lines.append(f"{name}{{{labels}}} {getattr(m, attribute)}")
+        return "\n".join(lines) + "\n"
@@ -3,13 +3,32 @@ Main entrypoint for this sample
 """
 
 import asyncio
+import time
 from websockets import connect
 import menu
+import config_api
 import keyboard
 import ess_api
 import event_types
 import event_viewer
 import state_viewer
+from event_pipeline import EventPipeline
+from name_store import NameStore
+
+# The names looked up are stored in this file, to be displayed right after a restart.
+# Set to None to look up all names again on every start.
+name_store_path = "names.db"
+
+# Received events wait in a queue of up to this many batches to be displayed, so slow name lookups
+# don't hold up receiving. When it is full, "block" waits for room, "drop-oldest" drops the oldest
+# batch, and "spill" writes batches to a temporary file until there is room again.
+# While "block" waits, the connection queues up to 100 more messages and then stops reading the
+# web socket, so memory stays bounded.
+pipeline_max_batches = 1000
+pipeline_overflow = "spill"
+# Tasks displaying events in the event viewer, which may then show them slightly out of order.
+# The state viewer uses one, as the order of state changes matters.
+event_viewer_workers = 4
 
 
 subscription_filters =  [
@@ -29,7 +48,76 @@ async def check_for_escape():
         await asyncio.sleep(0.1)  
 
 
-async def main(gateway_uri, access_token, mode):
+async def show_stats_on_key(pipeline):
+    while True:
+        if keyboard.is_pressed("s"):
+            print_pipeline_stats(pipeline)
+            # Wait for the key to be released, so one press prints once
+            while keyboard.is_pressed("s"):
+                await asyncio.sleep(0.1)
+        await asyncio.sleep(0.1)
+
+
+def print_pipeline_stats(pipeline):
+    stats = pipeline.stats()
+    print(f"[*] Queue depth {stats['depth']} (max {stats['maxDepth']}), events received {stats['received']}, processed {stats['processed']}, "
+          f"failed {stats['failed']}, dropped {stats['dropped']}, spilled {stats['spilled']}, "
+          f"lag {stats['averageLag'] * 1000:.0f} ms average, {stats['maxLag'] * 1000:.0f} ms max")
+
+
+async def main(gateway_uri, token_manager, mode):
+    # Configuration lookups use the current token of the token manager, and share a pool of
+    # connections to the API Gateway until the viewer is closed
+    config_api.token_manager = token_manager
+    await config_api.open_session()
+    if name_store_path is not None:
+        config_api.name_store = NameStore(name_store_path, gateway_uri)
+    load_names_task = None
+    try:
+        # Read the names of all event types, state groups and subscribed sources up front
+        resource_types = {"eventTypes", "stateGroups"}
+        for subscription_filter in subscription_filters:
+            resource_types.update(t for t in subscription_filter["resourceTypes"] if t != "*")
+        access_token = await token_manager.get_token_async()
+        if config_api.restore_names() > 0:
+            # Display the stored names right away, and look them up again in the background
+            load_names_task = asyncio.create_task(load_names(resource_types, gateway_uri, access_token))
+        else:
+            print("[*] LOADING NAMES...")
+            await load_names(resource_types, gateway_uri, access_token)
+
+        # Subscribing to configuration change events evicts the name of an item when it changes
+        config_change_types = await config_api.find_event_types(event_types.configuration_changed, gateway_uri, access_token)
+
+        await run_viewer(gateway_uri, token_manager, mode, config_change_types)
+    finally:
+        if load_names_task is not None:
+            load_names_task.cancel()
+        await config_api.close_session()
+        if config_api.name_store is not None:
+            config_api.name_store.close()
+            config_api.name_store = None
+
+
+async def load_names(resource_types, gateway_uri, access_token):
+    started = time.time()
+    await config_api.prefetch(resource_types, gateway_uri, access_token)
+    # Stored names that prefetch didn't refresh, e.g. of deleted items, are looked up one by one
+    await config_api.revalidate(gateway_uri, access_token, started)
+
+
+def evict_changed_items(events, config_change_types):
+    """ Evicts the names of the items in configuration change events, including lookups of them in progress, and returns the other events """
+    other_events = []
+    for event in events:
+        if event["type"] in config_change_types:
+            config_api.invalidate(event["source"])
+        else:
+            other_events.append(event)
+    return other_events
+
+
+async def run_viewer(gateway_uri, token_manager, mode, config_change_types):
     session_id = ""
     last_event_id = ""
 
@@ -38,8 +126,16 @@ async def main(gateway_uri, access_token, mode):
     
     if mode == "stateviewer":
         viewer = state_viewer
+        workers = 1
     elif mode == "eventviewer":
         viewer = event_viewer
+        workers = event_viewer_workers
+
+    # Events are displayed by the pipeline workers while the next ones are received
+    access_token = None
+    pipeline = EventPipeline(lambda events: viewer.process_events(events, gateway_uri, access_token), workers, pipeline_max_batches, pipeline_overflow)
+    pipeline.start()
+    stats_task = asyncio.create_task(show_stats_on_key(pipeline))
 
     # Connection loop: Reconnect on failure
     while not escape_task.done():
@@ -53,29 +149,42 @@ async def main(gateway_uri, access_token, mode):
 
             receive_events_task = None
 
-            async with connect(connection_uri, additional_headers={"Authorization": f"Bearer {access_token}"}) as web_socket:
+            # Get the current token on every (re)connect, as the previous one may have expired
+            access_token = await token_manager.get_token_async()
+
+            # The connection reads the web socket in the background, queueing events while commands are in flight
+            async with connect(connection_uri, additional_headers={"Authorization": f"Bearer {access_token}"}) as web_socket, ess_api.EssConnection(web_socket) as connection:
 
 
                 # Start or resume session
-                session = await ess_api.start_session(web_socket, session_id, last_event_id)
+                session = await ess_api.start_session(connection, session_id, last_event_id)
 
                 state_events = []
                 if session["status"] == 201:
                     # Create subscription
-                    subscription = await ess_api.create_subscription(web_socket, subscription_filters)
+                    subscription = await ess_api.create_subscription(connection, subscription_filters)
+                    if config_change_types:
+                        await ess_api.create_subscription(connection, [
+                            {
+                                "modifier": "include",
+                                "resourceTypes": [ "*" ],
+                                "sourceIds": [ "*" ],
+                                "eventTypes": config_change_types
+                            }
+                        ])
                     
                     session_id = session["sessionId"]
 
                     # Get state
                     if mode == "stateviewer":
-                        state = await ess_api.get_state(web_socket)
+                        state = await ess_api.get_state(connection)
                         state_events = state["states"]
 
-                await viewer.process_events(state_events, gateway_uri, access_token)
+                await pipeline.put(state_events)
 
                 # Receive events loop
                 while not escape_task.done():
-                    receive_events_task = asyncio.create_task(ess_api.receive_events(web_socket))
+                    receive_events_task = asyncio.create_task(ess_api.receive_events(connection))
 
                     # Wait for either events to be received or user escape
                     await asyncio.wait([receive_events_task, escape_task], return_when=asyncio.FIRST_COMPLETED)
@@ -85,8 +194,9 @@ async def main(gateway_uri, access_token, mode):
                     events = await receive_events_task
                     last_event_id = events["events"][-1]["id"]
 
-                    # Process events
-                    await viewer.process_events(events["events"], gateway_uri, access_token)
+                    # Queue events for processing, after evicting the names of changed items so they are looked up again
+                    viewer_events = evict_changed_items(events["events"], config_change_types)
+                    await pipeline.put(viewer_events)
 
             # Await the receive_events_task to observe exception
             if receive_events_task is not None:
@@ -98,8 +208,17 @@ async def main(gateway_uri, access_token, mode):
                 print("[*] RECONNECTING...")
                 await asyncio.sleep(1)
 
+    stats_task.cancel()
+    await pipeline.stop()
+    print_pipeline_stats(pipeline)
+    input("[*] Press ENTER to return to menu")
+
 
 if __name__ == '__main__':
     while True:
-        gateway_uri, access_token, mode = menu.show()
-        asyncio.run(main(gateway_uri, access_token, mode))
+        gateway_uri, token_manager, mode = menu.show()
+        try:
+            asyncio.run(main(gateway_uri, token_manager, mode))
+        finally:
+            # Stop renewing the token, also when the viewer failed or was interrupted
+            token_manager.stop()
@@ -8,6 +8,7 @@ import urllib3
 import identity_provider
 import config
 from http import HTTPStatus
+from token_manager import TokenError, TokenManager
 
 art = r"""
 
@@ -46,13 +47,18 @@ def login():
     session = requests.Session()
     server_url, username, password, is_basic_user = config.read_settings()
 
-    try:
-        response = identity_provider.get_token(session, username, password, server_url, is_basic_user, verify_ssl)
+    # The token manager renews the token in the background before it expires
+    token_manager = TokenManager(lambda: identity_provider.get_token(session, username, password, server_url, is_basic_user, verify_ssl))
 
-        if response.status_code == 200:
-            token_response = response.json()
-            access_token = token_response["access_token"]
-            return server_url, access_token
+    try:
+        token_manager.get_token()
+        token_manager.start()
+        return server_url, token_manager
+
+    except TokenError as e:
+        response = e.response
+        if response is None:
+            print(f"[!] Login failed: {e}")
         else:
             error = f"{response.status_code} ({HTTPStatus(response.status_code).phrase})"
             print(f"[!] Login failed: {error}")
@@ -73,14 +79,14 @@ def show():
         choice = input("[OPTION] ->")
 
         if choice == "1" or choice == "2":
-            server_url, access_token = login()
-            if access_token is None:
+            server_url, token_manager = login()
+            if token_manager is None:
                 continue
 
             if choice == "1":
-                return server_url, access_token, "stateviewer"
+                return server_url, token_manager, "stateviewer"
             elif choice == "2":
-                return server_url, access_token, "eventviewer"
+                return server_url, token_manager, "eventviewer"
 
         elif choice == "3":
             config.write_settings()
@@ -0,0 +1,65 @@
+"""
+Stores the names looked up by config_api in SQLite, so they can be displayed right after a
+restart while they are looked up again in the background.
+"""
+
+import sqlite3
+import time
+
+
+class NameStore:
+    """
+    Names per resource path and data key of one API Gateway, with the time each was last
+    looked up.
+    """
+
+    def __init__(self, path, gateway_uri):
+        self.gateway_uri = gateway_uri
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS names (
+                gateway TEXT NOT NULL,
+                resource_path TEXT NOT NULL,
+                data_key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (gateway, resource_path, data_key)
+            );
+            """
+        )
+
+    def load(self):
+        """Returns all stored names as a list of (resource_path, data_key, name) tuples"""
+        return self._db.execute(
+            "SELECT resource_path, data_key, name FROM names WHERE gateway = ?",
+            (self.gateway_uri,),
+        ).fetchall()
+
+    def stale(self, before):
+        """Returns the (resource_path, data_key) of the names last looked up before the given time.time()"""
+        return self._db.execute(
+            "SELECT resource_path, data_key FROM names WHERE gateway = ? AND updated < ?",
+            (self.gateway_uri, before),
+        ).fetchall()
+
+    def put(self, entries):
+        """Adds or replaces names, given as (resource_path, data_key, name) tuples"""
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO names (gateway, resource_path, data_key, name, updated) VALUES (?, ?, ?, ?, ?)",
+            [(self.gateway_uri, resource_path, data_key, name, now) for resource_path, data_key, name in entries],
+        )
+        self._db.commit()
+
+    def remove(self, resource_path, data_key):
+        self._db.execute(
+            "DELETE FROM names WHERE gateway = ? AND resource_path = ? AND data_key = ?",
+            (self.gateway_uri, resource_path, data_key),
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
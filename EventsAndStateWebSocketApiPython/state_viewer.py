@@ -20,7 +20,7 @@ def display_header():
         os.system("cls")
     else:
         os.system("clear")
-    print("Press ESC to return to menu")
+    print("Press ESC to return to menu, S to show queue statistics")
     print("=" * 100)
     print("Source".ljust(50), "State group".ljust(30), "State".ljust(30))
     print("=" * 100)
@@ -2,6 +2,7 @@ import json
 import requests
 import identity_provider
 import urllib3
+from concurrent.futures import ThreadPoolExecutor
 
 
 def main():
@@ -18,7 +19,9 @@ def main():
             urllib3.exceptions.InsecureRequestWarning
         )  # Remove this line if verifying the certificate (which is recommended)
 
-    # First we need a session to ensure that we stay logged in
+    # First we need a session to ensure that we stay logged in.
+    # All requests are sent through it, reusing its connections instead of a new connection
+    # and TLS handshake per request
     session = requests.Session()
 
     # Now authenticate using the identity provider and get access token
@@ -42,7 +45,7 @@ def main():
     }
 
     # Get an existing user defined event type
-    response = requests.get(
+    response = session.get(
         f"{serverUrl}/api/rest/v1/userDefinedEvents", headers=headers, verify=verify
     )
     if response.status_code != 200:
@@ -66,7 +69,7 @@ def main():
     print(f"Triggering an event for event type {event_type['id']}")
 
     # Trigger an event
-    response = requests.post(
+    response = session.post(
         f"{serverUrl}/api/rest/v1/events",
         headers=headers,
         data=json.dumps({"type": event_type["id"]}),
@@ -81,7 +84,7 @@ def main():
     print(f"Triggered an event: {event}")
 
     # Retrieve the first 10 events with additional event data
-    response = requests.get(
+    response = session.get(
         f"{serverUrl}/api/rest/v1/events?page=0&size=10&include=data", headers=headers, verify=verify
     )
     if response.status_code != 200:
@@ -93,7 +96,7 @@ def main():
     print(f"Retrieved first page of events: {events}")
 
     # Retrieve an event by id
-    response = requests.get(
+    response = session.get(
         f"{serverUrl}/api/rest/v1/events/{events[-1]['id']}",
         headers=headers,
         verify=verify,
@@ -110,6 +113,62 @@ def main():
     event = response.json()["data"]
     print(f"Retrieved an event: {event}")
 
+    # Walk through all events, one page at a time, without loading them all into memory
+    event_count = 0
+    for event in get_all_pages(
+        session,
+        f"{serverUrl}/api/rest/v1/events",
+        headers,
+        verify,
+        params={"include": "data"},
+    ):
+        event_count += 1
+    print(f"Retrieved {event_count} events in total")
+
+
+def get_all_pages(
+    session: requests.Session,
+    url: str,
+    headers: dict,
+    verify: bool,
+    page_size: int = 100,
+    params: dict = {},
+):
+    """Yields all items of a list, one page at a time.
+
+    The next page is requested in the background while the items of the current page are
+    being consumed, so at most two pages are held in memory at any time.
+    Raises requests.HTTPError if a page can't be retrieved, rather than ending the list early.
+    """
+
+    def get_page(page):
+        return session.get(
+            url,
+            headers=headers,
+            params={**params, "page": page, "size": page_size},
+            verify=verify,
+        )
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = 0
+        next_page = executor.submit(get_page, page)
+        while next_page is not None:
+            response = next_page.result()
+            if response.status_code != 200:
+                raise requests.HTTPError(
+                    f"Unable to retrieve page {page}: status {response.status_code}, {response.text}",
+                    response=response,
+                )
+            items = response.json()["array"]
+            page += 1
+            next_page = None
+            if page == 1:
+                # The server may cap the page size, so a full page is as long as the first one
+                full_page = len(items)
+            if items and len(items) >= full_page:
+                next_page = executor.submit(get_page, page)
+            yield from items
+
 
 if __name__ == "__main__":
     main()
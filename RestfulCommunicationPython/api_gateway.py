@@ -1,9 +1,24 @@
 """
 Gateway class used for calling the REST API.
 """
+import hashlib
 import json
+import time
 import requests
 import urllib3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+from instrumentation import Instrumentation, RequestRecord
+from projection import Projection
+from response_cache import ResponseCache
+from retry_policy import (
+    CircuitBreaker,
+    GatewayConnectionError,
+    GatewayError,
+    RetryPolicy,
+    get_circuit_breaker,
+)
+from token_manager import TokenManager
 
 # Remove the line below if verifying the certificate (which is recommended)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -14,12 +29,40 @@ class Gateway:
     Class representing API Gateway.
     """
 
-    def __init__(self, serverUrl: str):
+    def __init__(
+        self,
+        serverUrl: str,
+        cache: ResponseCache = None,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
+        instrumentation: Instrumentation = None,
+        token_manager: TokenManager = None,
+    ):
         """Constructor
 
         :param server: The host name of the API Gateway, e.g. vms.example.com
+        :param cache: Optional ResponseCache used for GET requests. Any other request
+            invalidates the cached responses of the resource type it targets.
+        :param retry_policy: Optional RetryPolicy deciding which failed requests are retried.
+            By default, a request is retried up to 3 times.
+        :param circuit_breaker: Optional CircuitBreaker. By default, the breaker shared by all
+            gateways for the same host is used.
+        :param instrumentation: Optional Instrumentation collecting metrics of every request
+            sent to the server
+        :param token_manager: Optional TokenManager providing the bearer token of every
+            request, in place of the token passed to each method. A request rejected with
+            401 Unauthorized is sent once more with a renewed token.
         """
         self._serverUrl = serverUrl
+        self._cache = cache
+        self.instrumentation = instrumentation
+        self.token_manager = token_manager
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = (
+            circuit_breaker
+            if circuit_breaker is not None
+            else get_circuit_breaker(serverUrl)
+        )
 
     def get(
         self, session: requests.Session, resource_plural: str, token: str
@@ -36,6 +79,61 @@ class Gateway:
         url = self.__url(resource_plural)
         return self.__request(session, "GET", url, token)
 
+    def get_paged(
+        self,
+        session: requests.Session,
+        resource_plural: str,
+        token: str,
+        page_size: int = 100,
+        params: dict = {},
+        projection: Projection = None,
+    ) -> Iterator[dict]:
+        """Retrieves all items of a list, one page at a time.
+
+        The next page is requested in the background while the items of the current page are
+        being consumed, and at most two pages are held in memory at any time.
+
+        :param session: A requests.Session object which will be used for the duration of the
+            integration to maintain logged-in state
+        :param resource_plural: The name of the resource to access, e.g. cameras, events or alarms
+        :param token: The bearer access token to use.
+        :param page_size: The number of items to request per page
+        :param params: Additional request parameters as a dict, e.g. {"include": "data"}
+        :param projection: Optional Projection decoding only some fields of each item
+
+        :returns: Generator yielding the items of the list, as dicts or, with a projection,
+            as objects with one attribute per field.
+        :raises GatewayError: If a page can't be retrieved, so that a failure is never taken
+            for the end of the list
+        """
+        url = self.__url(resource_plural)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = 0
+            next_page = executor.submit(
+                self.__get_page, session, url, token, params, page, page_size
+            )
+            while next_page is not None:
+                response = next_page.result()
+                if response.status_code != 200:
+                    raise GatewayError(
+                        f"Unable to retrieve page {page} of {resource_plural}: "
+                        f"status {response.status_code}"
+                    )
+                if projection is not None:
+                    items = projection.decode(response.content)
+                else:
+                    items = response.json()["array"]
+                page += 1
+                next_page = None
+                if page == 1:
+                    # The server may cap the page size, so a full page is as long as the first one
+                    full_page = len(items)
+                if items and len(items) >= full_page:
+                    next_page = executor.submit(
+                        self.__get_page, session, url, token, params, page, page_size
+                    )
+                yield from items
+
     def get_single(
         self, session: requests.Session, resource_plural: str, obj_id: str, token: str
     ) -> requests.Response:
@@ -235,6 +333,19 @@ class Gateway:
         url = self.__url(resource_plural, obj_id=obj_id)
         return self.__request(session, "DELETE", url, token)
 
+    def __get_page(
+        self,
+        session: requests.Session,
+        url: str,
+        token: str,
+        params: dict,
+        page: int,
+        page_size: int,
+    ) -> requests.Response:
+        """Requests a single page of a list."""
+        params = {**params, "page": page, "size": page_size}
+        return self.__request(session, "GET", url, token, params=params)
+
     def __request(
         self,
         session: requests.Session,
@@ -250,35 +361,157 @@ class Gateway:
             the integration to maintain logged-in state
         :param verb: Request method
         :param url: Request URI
-        :param token: The bearer access token to use
+        :param token: The bearer access token to use, unless the gateway has a token manager
         :param params: Request parameters as a dict
         :param payload: Request body as a string
 
         :returns: requests.Response object
+
+        :raises GatewayConnectionError: If the API Gateway could not be reached after all retries
+        :raises CircuitOpenError: If the circuit breaker of the API Gateway is open
         """
+        if self.token_manager is not None:
+            token = self.token_manager.get_token()
         tokenstring = "Bearer " + token
         headers = {"Authorization": tokenstring}
         # dict {'param1': 'value1', 'param2': None} becomes query string 'param1=value1&param2'
         params = "&".join([k if v is None else f"{k}={v}" for k, v in params.items()])
 
-        # Replace verify=False below with this instead to verify the certificate:
-        #   verify='path/to/certificate'
+        cache_key = None
+        cached = None
+        if self._cache is not None:
+            if verb == "GET":
+                cache_key = self.__cache_key(url, params, token)
+                cached = self._cache.lookup(cache_key)
+                if cached is not None:
+                    if self._cache.is_fresh(cached, self.__cached_type(url)):
+                        return cached.response
+                    headers.update(cached.validator_headers())
+            else:
+                self._cache.invalidate(self.__resource_url(url))
+
+        res = self.__send_instrumented(session, verb, url, headers, params, payload)
+        if res.status_code == 401 and self.token_manager is not None:
+            # The token was revoked or expired early, so renew it and try once more
+            token = self.token_manager.renew(token)
+            headers["Authorization"] = "Bearer " + token
+            res = self.__send_instrumented(session, verb, url, headers, params, payload)
+            if cache_key is not None:
+                cache_key = self.__cache_key(url, params, token)
+        if cached is not None and res.status_code == 304:
+            return self._cache.revalidated(cached)
         try:
-            res = session.request(
-                verb, url, headers=headers, params=params, data=payload, verify=False
-            )
             res.raise_for_status()
+            if cache_key is not None and res.status_code == 200:
+                self._cache.store(cache_key, res)
         except requests.exceptions.HTTPError as err:
             # you could catch 400 Bad Request etc. here
             print(err)
-        except requests.exceptions.ConnectionError as err:
-            raise SystemExit(err)
-        except requests.exceptions.Timeout as err:
-            raise SystemExit(err)
-        except requests.exceptions.RequestException as err:
-            raise SystemExit(err)
         return res
 
+    def __send_instrumented(
+        self,
+        session: requests.Session,
+        verb: str,
+        url: str,
+        headers: dict,
+        params: str,
+        payload: str,
+    ) -> requests.Response:
+        """Sends a request, reporting it to the instrumentation if any."""
+        if self.instrumentation is None:
+            return self.__send(session, verb, url, headers, params, payload)[0]
+
+        resource_plural = self.__resource_url(url)[len(self.__url("")) :]
+        self.instrumentation.started(verb, resource_plural)
+        start = time.perf_counter()
+        res, retries, error = None, 0, None
+        try:
+            res, retries = self.__send(session, verb, url, headers, params, payload)
+            return res
+        except GatewayError as err:
+            error = err
+            raise
+        finally:
+            self.instrumentation.completed(
+                RequestRecord(
+                    verb,
+                    resource_plural,
+                    res.status_code if res is not None else None,
+                    time.perf_counter() - start,
+                    len(payload.encode()) if payload else 0,
+                    len(res.content) if res is not None else 0,
+                    retries,
+                    error,
+                )
+            )
+
+    def __send(
+        self,
+        session: requests.Session,
+        verb: str,
+        url: str,
+        headers: dict,
+        params: str,
+        payload: str,
+    ):
+        """Sends a request, retrying it according to the retry policy.
+
+        :returns: Tuple of the requests.Response object and the number of retries made
+        """
+        attempt = 0
+        while True:
+            self.circuit_breaker.allow_or_raise(url)
+            # Replace verify=False below with this instead to verify the certificate:
+            #   verify='path/to/certificate'
+            try:
+                res = session.request(
+                    verb, url, headers=headers, params=params, data=payload, verify=False
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as err:
+                self.circuit_breaker.record_failure()
+                delay = self.retry_policy.retry_delay(verb, attempt, error=err)
+                if delay is None:
+                    raise GatewayConnectionError(f"{verb} {url}: {err}") from err
+            except requests.exceptions.RequestException as err:
+                # E.g. an invalid URL; says nothing about the health of the API Gateway
+                self.circuit_breaker.release_trial()
+                raise GatewayError(f"{verb} {url}: {err}") from err
+            except BaseException:
+                self.circuit_breaker.release_trial()
+                raise
+            else:
+                self.circuit_breaker.record_response(res.status_code)
+                delay = self.retry_policy.retry_delay(
+                    verb, attempt, status=res.status_code, headers=res.headers
+                )
+                if delay is None:
+                    return res, attempt
+            attempt += 1
+            time.sleep(delay)
+
+    def __cache_key(self, url: str, params: str, token: str) -> str:
+        """Returns the key of a GET request in the ResponseCache, identifying the user by a
+        hash of the token."""
+        user = hashlib.sha256(token.encode()).hexdigest()[:16]
+        if params:
+            return f"{url}?{params}#{user}"
+        return f"{url}#{user}"
+
+    def __cached_type(self, url: str) -> str:
+        """Returns the resource type of a request URI for a list or a single item, or None
+        for e.g. child items."""
+        parts = url[len(self.__url("")) :].split("?")[0].split("/")
+        return parts[0] if len(parts) <= 2 else None
+
+    def __resource_url(self, url: str) -> str:
+        """Returns the URI of the resource type targeted by a request URI."""
+        base = self.__url("")
+        return base + url[len(base) :].split("/")[0]
+
     def __url(
         self, resource_plural: str, obj_id: str = None, child_item_type: str = None
     ):
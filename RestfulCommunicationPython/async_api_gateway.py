@@ -0,0 +1,538 @@
+"""
+Asynchronous Gateway class used for calling the REST API concurrently.
+"""
+import asyncio
+import time
+import aiohttp
+from typing import AsyncIterator
+from http2_transport import AsyncHttp2Session
+from instrumentation import Instrumentation, RequestRecord
+from projection import Projection
+from retry_policy import (
+    CircuitBreaker,
+    GatewayConnectionError,
+    GatewayError,
+    RetryPolicy,
+    get_circuit_breaker,
+)
+from token_manager import TokenManager
+
+
+def create_session(
+    limit: int = 100, keepalive_timeout: float = 30, http2: bool = False
+) -> aiohttp.ClientSession:
+    """Creates a client session with a keep-alive connection pool.
+
+    The session should be shared by all calls made through an AsyncGateway and closed when
+    the integration is done, e.g. by using it as an async context manager.
+
+    :param limit: The maximum number of simultaneously open connections
+    :param keepalive_timeout: Seconds an idle connection is kept open for reuse
+    :param http2: Whether to multiplex all requests over a single HTTP/2 connection instead.
+        Requires the httpx package with HTTP/2 support.
+
+    :returns: aiohttp.ClientSession object, or http2_transport.AsyncHttp2Session object
+    """
+    if http2:
+        # Replace verify=False below with an ssl.SSLContext to verify the certificate
+        return AsyncHttp2Session(verify=False, max_connections=limit)
+
+    # Replace ssl=False below with an ssl.SSLContext to verify the certificate
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit,
+        keepalive_timeout=keepalive_timeout,
+        ssl=False,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+class AsyncGateway:
+    """
+    Class representing API Gateway, using asyncio.
+
+    Methods mirror those of api_gateway.Gateway, but are coroutines taking an
+    aiohttp.ClientSession (see create_session) instead of a requests.Session.
+    The responses returned have already been read, so response.status, response.headers
+    and await response.json() can be used after the call returns.
+    """
+
+    def __init__(
+        self,
+        serverUrl: str,
+        max_concurrency: int = 32,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
+        instrumentation: Instrumentation = None,
+        token_manager: TokenManager = None,
+    ):
+        """Constructor
+
+        :param serverUrl: The URL of the API Gateway, e.g. https://vms.example.com
+        :param max_concurrency: The maximum number of requests in flight at the same time
+        :param retry_policy: Optional RetryPolicy deciding which failed requests are retried.
+            By default, a request is retried up to 3 times.
+        :param circuit_breaker: Optional CircuitBreaker. By default, the breaker shared by all
+            gateways for the same host is used.
+        :param instrumentation: Optional Instrumentation collecting metrics of every request
+            sent to the server
+        :param token_manager: Optional TokenManager providing the bearer token of every
+            request, in place of the token passed to each method. A request rejected with
+            401 Unauthorized is sent once more with a renewed token.
+        """
+        self._serverUrl = serverUrl
+        self._max_concurrency = max_concurrency
+        self.instrumentation = instrumentation
+        self.token_manager = token_manager
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = (
+            circuit_breaker
+            if circuit_breaker is not None
+            else get_circuit_breaker(serverUrl)
+        )
+        # Created on first use so that it belongs to the running event loop
+        self._semaphore = None
+
+    async def get(
+        self, session: aiohttp.ClientSession, resource_plural: str, token: str
+    ) -> aiohttp.ClientResponse:
+        """Retrieves a list of items.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource to access
+        :param token: The bearer access token to use.
+
+        :returns: aiohttp.ClientResponse object.
+        """
+        url = self.__url(resource_plural)
+        return await self.__request(session, "GET", url, token)
+
+    async def get_paged(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        token: str,
+        page_size: int = 100,
+        params: dict = {},
+        projection: Projection = None,
+    ) -> AsyncIterator[dict]:
+        """Retrieves all items of a list, one page at a time.
+
+        The next page is requested in the background while the items of the current page are
+        being consumed, and at most two pages are held in memory at any time.
+        To stop iterating early, wrap the call in contextlib.aclosing() so that the pending
+        page request is cancelled right away.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource to access, e.g. cameras, events or alarms
+        :param token: The bearer access token to use.
+        :param page_size: The number of items to request per page
+        :param params: Additional request parameters as a dict, e.g. {"include": "data"}
+        :param projection: Optional Projection decoding only some fields of each item
+
+        :returns: Async generator yielding the items of the list, as dicts or, with a
+            projection, as objects with one attribute per field.
+        :raises GatewayError: If a page can't be retrieved, so that a failure is never taken
+            for the end of the list
+        """
+        url = self.__url(resource_plural)
+        page = 0
+        next_page = asyncio.ensure_future(
+            self.__get_page(session, url, token, params, page, page_size)
+        )
+        try:
+            while next_page is not None:
+                response = await next_page
+                if response.status != 200:
+                    raise GatewayError(
+                        f"Unable to retrieve page {page} of {resource_plural}: "
+                        f"status {response.status}"
+                    )
+                if projection is not None:
+                    # The body was read before the response was released, and newer aiohttp
+                    # versions refuse read() after release, while text() decodes the read body
+                    items = projection.decode(await response.text())
+                else:
+                    items = (await response.json())["array"]
+                page += 1
+                next_page = None
+                if page == 1:
+                    # The server may cap the page size, so a full page is as long as the first one
+                    full_page = len(items)
+                if items and len(items) >= full_page:
+                    next_page = asyncio.ensure_future(
+                        self.__get_page(session, url, token, params, page, page_size)
+                    )
+                for item in items:
+                    yield item
+        finally:
+            # Don't leave a prefetch running if the caller stops iterating early
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
+    async def get_single(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        obj_id: str,
+        token: str,
+    ) -> aiohttp.ClientResponse:
+        """Retrieves a single item by id.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource to access.
+        :param obj_id: The id of the specific item to retrieve from the server.
+        :param token: The bearer access token to use.
+
+        :returns: aiohttp.ClientResponse object
+        """
+        url = self.__url(resource_plural, obj_id=obj_id)
+        return await self.__request(session, "GET", url, token)
+
+    async def get_child_items(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        obj_id: str,
+        child_item_type: str,
+        token: str,
+    ) -> aiohttp.ClientResponse:
+        """Gets a list of child items of a specific item.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource to access
+        :param obj_id: The id of the specific item whose child items should be retrieved
+        :param child_item_type: The item type of the child items to retrieve
+        :param token: The bearer access token to use.
+
+        :returns: aiohttp.ClientResponse object
+        """
+        url = self.__url(
+            resource_plural, obj_id=obj_id, child_item_type=child_item_type
+        )
+        return await self.__request(session, "GET", url, token)
+
+    async def get_child_item_tasks(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        obj_id: str,
+        child_item_type: str,
+        token: str,
+    ) -> aiohttp.ClientResponse:
+        """Gets a list of tasks available on a specific child item type of a specific item
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource to access
+        :param obj_id: The id of the specific item whose child item tasks should be retrieved
+        :param child_item_type: The item type of the child items for which to retrieve tasks
+        :param token: The bearer access token to use.
+
+        :returns: aiohttp.ClientResponse object. If success, the response body is a JSON object with a 'tasks' array
+        """
+        url = self.__url(
+            resource_plural, obj_id=obj_id, child_item_type=child_item_type
+        )
+        params = {"tasks": None, "noData": None}
+        return await self.__request(session, "GET", url, token, params=params)
+
+    async def get_tasks(
+        self, session: aiohttp.ClientSession, resource_plural: str, token: str
+    ) -> aiohttp.ClientResponse:
+        """Gets a list of tasks available on a specific item type.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource type to get tasks for.
+        :param token: The bearer access token to use.
+
+        :returns: aiohttp.ClientResponse object
+        """
+        url = self.__url(resource_plural)
+        params = {"tasks": None, "noData": None}
+        return await self.__request(session, "GET", url, token, params=params)
+
+    async def perform_task(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        obj_id: str,
+        task: str,
+        payload: str,
+        token: str,
+    ) -> aiohttp.ClientResponse:
+        """Invokes a task on a specific item.
+
+        Technically invokes a task asynchronously, which may then be retrieved using the
+        resource_plural "tasks" and the id supplied in the response.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource type of the object
+        :param obj_id: The id of the object on which the task will be performed
+        :param task: The id (e.g. getDevicePresets) of the task to perform
+        :param payload: A JSON string representing the payload of the request
+        :param token: The bearer access token to use.
+
+        :returns: aiohttp.ClientResponse object
+        """
+        url = self.__url(resource_plural, obj_id=obj_id)
+        params = {"task": task}
+        return await self.__request(
+            session, "POST", url, token, params=params, payload=payload
+        )
+
+    async def perform_child_task(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        obj_id: str,
+        child_item_type: str,
+        task: str,
+        payload: str,
+        token: str,
+    ) -> aiohttp.ClientResponse:
+        """Performs a child item type based task on a specific item.
+
+        Technically starts a task asynchronously, which may then be retrieved using the
+        resource_plural "tasks" and the id supplied in the response.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource type of the object.
+        :param obj_id: The id of the object on whose child items the task should be performed.
+        :param child_item_type: The child item type on which to perform the task.
+        :param task: The id of the task to be performed.
+        :param payload: JSON string representation of the request body.
+        :param token: The bearer access token to use.
+
+        :returns: aiohttp.ClientResponse object.
+        """
+        url = self.__url(
+            resource_plural, obj_id=obj_id, child_item_type=child_item_type
+        )
+        params = {"task": task}
+        return await self.__request(
+            session, "POST", url, token, params=params, payload=payload
+        )
+
+    async def create_item(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        payload: str,
+        token: str,
+    ) -> aiohttp.ClientResponse:
+        """Creates an item on the server.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource type of the object
+        :param payload: A JSON string representing the payload of the request
+        :param token: The bearer access token to use
+
+        :returns: aiohttp.ClientResponse object
+        """
+        url = self.__url(resource_plural)
+        return await self.__request(session, "POST", url, token, payload=payload)
+
+    async def update_item(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        payload: str,
+        obj_id: str,
+        token: str,
+    ) -> aiohttp.ClientResponse:
+        """Updates an item.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource type of the object
+        :param payload: A JSON string representing the payload of the request
+        :param obj_id: The id of the item to update
+        :param token: The bearer access token to use
+
+        :returns: aiohttp.ClientResponse object
+        """
+        url = self.__url(resource_plural, obj_id=obj_id)
+        return await self.__request(session, "PUT", url, token, payload=payload)
+
+    async def delete_item(
+        self,
+        session: aiohttp.ClientSession,
+        resource_plural: str,
+        obj_id: str,
+        token: str,
+    ) -> aiohttp.ClientResponse:
+        """Deletes an item.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param resource_plural: The name of the resource type of the object
+        :param obj_id: The id of the object to delete
+        :param token: The bearer access token to use
+
+        :returns: aiohttp.ClientResponse object
+        """
+        url = self.__url(resource_plural, obj_id=obj_id)
+        return await self.__request(session, "DELETE", url, token)
+
+    async def __get_page(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        token: str,
+        params: dict,
+        page: int,
+        page_size: int,
+    ) -> aiohttp.ClientResponse:
+        """Requests a single page of a list."""
+        params = {**params, "page": page, "size": page_size}
+        return await self.__request(session, "GET", url, token, params=params)
+
+    async def __request(
+        self,
+        session: aiohttp.ClientSession,
+        verb: str,
+        url: str,
+        token: str,
+        params: dict = {},
+        payload: str = "",
+    ) -> aiohttp.ClientResponse:
+        """Submits request through session using bearer token.
+
+        At most max_concurrency requests are in flight at any time; additional calls wait
+        for a free slot, so any number of calls can be gathered at once.
+
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param verb: Request method
+        :param url: Request URI
+        :param token: The bearer access token to use, unless the gateway has a token manager
+        :param params: Request parameters as a dict
+        :param payload: Request body as a string
+
+        :returns: aiohttp.ClientResponse object with the body already read
+
+        :raises GatewayConnectionError: If the API Gateway could not be reached after all retries
+        :raises CircuitOpenError: If the circuit breaker of the API Gateway is open
+        """
+        if self.token_manager is not None:
+            token = await self.token_manager.get_token_async()
+        tokenstring = "Bearer " + token
+        headers = {"Authorization": tokenstring}
+        # dict {'param1': 'value1', 'param2': None} becomes query string 'param1=value1&param2'
+        query = "&".join([k if v is None else f"{k}={v}" for k, v in params.items()])
+        if query:
+            url += "?" + query
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        res = await self.__send_instrumented(session, verb, url, headers, payload)
+        if res.status == 401 and self.token_manager is not None:
+            # The token was revoked or expired early, so renew it and try once more
+            token = await self.token_manager.renew_async(token)
+            headers["Authorization"] = "Bearer " + token
+            res = await self.__send_instrumented(session, verb, url, headers, payload)
+        try:
+            res.raise_for_status()
+        except aiohttp.ClientResponseError as err:
+            # you could catch 400 Bad Request etc. here
+            print(err)
+        return res
+
+    async def __send_instrumented(
+        self,
+        session: aiohttp.ClientSession,
+        verb: str,
+        url: str,
+        headers: dict,
+        payload: str,
+    ) -> aiohttp.ClientResponse:
+        """Sends a request, reporting it to the instrumentation if any."""
+        if self.instrumentation is None:
+            return (await self.__send(session, verb, url, headers, payload))[0]
+
+        base = self.__url("")
+        resource_plural = url[len(base) :].split("/")[0].split("?")[0]
+        self.instrumentation.started(verb, resource_plural)
+        start = time.perf_counter()
+        res, size, retries, error = None, 0, 0, None
+        try:
+            res, size, retries = await self.__send(session, verb, url, headers, payload)
+            return res
+        except GatewayError as err:
+            error = err
+            raise
+        finally:
+            self.instrumentation.completed(
+                RequestRecord(
+                    verb,
+                    resource_plural,
+                    res.status if res is not None else None,
+                    time.perf_counter() - start,
+                    len(payload.encode()) if payload else 0,
+                    size,
+                    retries,
+                    error,
+                )
+            )
+
+    async def __send(
+        self,
+        session: aiohttp.ClientSession,
+        verb: str,
+        url: str,
+        headers: dict,
+        payload: str,
+    ):
+        """Sends a request, retrying it according to the retry policy.
+
+        The concurrency slot is released while waiting to retry.
+
+        :returns: Tuple of the aiohttp.ClientResponse object, the size of its body, and the
+            number of retries made
+        """
+        attempt = 0
+        while True:
+            self.circuit_breaker.allow_or_raise(url)
+            try:
+                async with self._semaphore:
+                    async with session.request(
+                        verb, url, headers=headers, data=payload
+                    ) as res:
+                        # Read the body before the connection is released back to the pool
+                        body = await res.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+                self.circuit_breaker.record_failure()
+                delay = self.retry_policy.retry_delay(verb, attempt, error=err)
+                if delay is None:
+                    raise GatewayConnectionError(f"{verb} {url}: {err}") from err
+            except aiohttp.ClientError as err:
+                # E.g. an invalid URL; says nothing about the health of the API Gateway
+                self.circuit_breaker.release_trial()
+                raise GatewayError(f"{verb} {url}: {err}") from err
+            except BaseException:
+                # E.g. cancelled; the request has no result, but must not hold the trial
+                self.circuit_breaker.release_trial()
+                raise
+            else:
+                self.circuit_breaker.record_response(res.status)
+                delay = self.retry_policy.retry_delay(
+                    verb, attempt, status=res.status, headers=res.headers
+                )
+                if delay is None:
+                    return res, len(body), attempt
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def __url(
+        self, resource_plural: str, obj_id: str = None, child_item_type: str = None
+    ):
+        """Formats request URI.
+
+        :param resource_plural: The name of the resource type
+        :param obj_id: Optional id of object
+        :param child_item_type: Optional child item type
+        """
+        result = f"{self._serverUrl}/api/rest/v1/{resource_plural}"
+        if obj_id is not None:
+            result += "/" + obj_id
+        if child_item_type is not None:
+            result += "/" + child_item_type
+        return result
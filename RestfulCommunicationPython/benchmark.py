@@ -0,0 +1,284 @@
+"""
+Benchmark of the sequential and concurrent REST client paths, run against the local mock
+API Gateway.
+
+Run it with e.g. "python benchmark.py --requests 500 --latency 0.005". Save the results with
+--json, and compare a later run with them using --baseline to catch regressions offline.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+import requests
+import identity_provider
+from api_gateway import Gateway
+from async_api_gateway import AsyncGateway, create_session
+from instrumentation import Instrumentation
+from mock_api_gateway import MockApiGateway
+
+
+class BenchmarkResult:
+    """
+    Class representing the measurements of a single benchmark scenario.
+    """
+
+    def __init__(
+        self, name: str, request_count: int, elapsed: float, latencies: list
+    ):
+        """Constructor
+
+        :param name: The name of the scenario
+        :param request_count: The number of requests sent
+        :param elapsed: Seconds from the first request was sent until the last completed
+        :param latencies: Seconds of each request
+        """
+        self.name = name
+        self.requests = request_count
+        self.elapsed = elapsed
+        self.throughput = request_count / elapsed if elapsed else 0.0
+        latencies = sorted(latencies)
+        self.p50 = _percentile(latencies, 0.5)
+        self.p99 = _percentile(latencies, 0.99)
+        self.peak_memory = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "latencyP50": self.p50,
+            "latencyP99": self.p99,
+            "peakMemory": self.peak_memory,
+        }
+
+    def __str__(self):
+        return (
+            f"{self.name:<28} {self.requests:>7} {self.throughput:>9.1f} "
+            f"{self.p50 * 1000:>9.2f} {self.p99 * 1000:>9.2f} "
+            f"{self.peak_memory / 1024:>10.0f}"
+        )
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def measure(name: str, scenario, *args) -> BenchmarkResult:
+    """Runs a scenario twice: once for timing, and once under tracemalloc for peak memory.
+
+    :param name: The name of the scenario
+    :param scenario: Function taking an Instrumentation, followed by args. Coroutine
+        functions are run with asyncio.run().
+
+    :returns: BenchmarkResult object
+    """
+
+    def run(instrumentation):
+        if asyncio.iscoroutinefunction(scenario):
+            return asyncio.run(scenario(instrumentation, *args))
+        return scenario(instrumentation, *args)
+
+    latencies = []
+    instrumentation = Instrumentation()
+    instrumentation.add_post_hook(lambda record: latencies.append(record.latency))
+    start = time.perf_counter()
+    run(instrumentation)
+    result = BenchmarkResult(
+        name, len(latencies), time.perf_counter() - start, latencies
+    )
+
+    # Tracing allocations slows the client down, so memory is measured in a separate run
+    tracemalloc.start()
+    run(Instrumentation())
+    result.peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def sequential_get_single(instrumentation, serverUrl, token, camera_ids):
+    api_gateway = Gateway(serverUrl, instrumentation=instrumentation)
+    with requests.Session() as session:
+        for camera_id in camera_ids:
+            api_gateway.get_single(session, "cameras", camera_id, token)
+
+
+def sequential_get_paged(instrumentation, serverUrl, token, resource, params):
+    api_gateway = Gateway(serverUrl, instrumentation=instrumentation)
+    with requests.Session() as session:
+        for _ in api_gateway.get_paged(session, resource, token, params=params):
+            pass
+
+
+def sequential_get_token(instrumentation, serverUrl, count):
+    with requests.Session() as session:
+        for _ in range(count):
+            identity_provider.get_token(
+                session, "username", "password", serverUrl, True, instrumentation
+            )
+
+
+async def concurrent_get_single(
+    instrumentation, serverUrl, token, camera_ids, max_concurrency
+):
+    api_gateway = AsyncGateway(
+        serverUrl, max_concurrency=max_concurrency, instrumentation=instrumentation
+    )
+    async with create_session() as session:
+        await asyncio.gather(
+            *[
+                api_gateway.get_single(session, "cameras", camera_id, token)
+                for camera_id in camera_ids
+            ]
+        )
+
+
+async def concurrent_get_paged(instrumentation, serverUrl, token, resource, params):
+    api_gateway = AsyncGateway(serverUrl, instrumentation=instrumentation)
+    async with create_session() as session:
+        async for _ in api_gateway.get_paged(session, resource, token, params=params):
+            pass
+
+
+def run_benchmarks(serverUrl: str, count: int, max_concurrency: int) -> list:
+    """Runs all scenarios against the API Gateway at serverUrl.
+
+    :param serverUrl: The URL of the API Gateway, e.g. the URL of a MockApiGateway
+    :param count: The number of single item requests per scenario
+    :param max_concurrency: The maximum number of requests in flight in concurrent scenarios
+
+    :returns: List of BenchmarkResult objects
+    """
+    with requests.Session() as session:
+        token = identity_provider.get_token(
+            session, "username", "password", serverUrl, True
+        ).json()["access_token"]
+        cameras = Gateway(serverUrl).get(session, "cameras", token).json()["array"]
+    camera_ids = [cameras[i % len(cameras)]["id"] for i in range(count)]
+    scenarios = [
+        ("token sequential", sequential_get_token, serverUrl, count // 10 or 1),
+        ("cameras/id sequential", sequential_get_single, serverUrl, token, camera_ids),
+        (
+            "cameras/id concurrent",
+            concurrent_get_single,
+            serverUrl,
+            token,
+            camera_ids,
+            max_concurrency,
+        ),
+    ]
+    for resource, params in (
+        ("cameras", {}),
+        ("events", {"include": "data"}),
+        ("alarms", {"include": "data"}),
+    ):
+        scenarios.append(
+            (
+                f"{resource} paged sequential",
+                sequential_get_paged,
+                serverUrl,
+                token,
+                resource,
+                params,
+            )
+        )
+        scenarios.append(
+            (
+                f"{resource} paged async",
+                concurrent_get_paged,
+                serverUrl,
+                token,
+                resource,
+                params,
+            )
+        )
+    return [measure(*scenario) for scenario in scenarios]
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """Compares results with a baseline.
+
+    :param results: List of BenchmarkResult objects
+    :param baseline: List of result dicts, as saved with --json
+    :param threshold: The fraction a measurement may get worse before it is a regression
+
+    :returns: List of descriptions of the regressions found
+    """
+    previous = {entry["name"]: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result.name)
+        if before is None:
+            continue
+        if result.throughput < before["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{result.name}: throughput {result.throughput:.1f} req/s, "
+                f"was {before['throughput']:.1f}"
+            )
+        if result.p99 > before["latencyP99"] * (1 + threshold):
+            regressions.append(
+                f"{result.name}: p99 {result.p99 * 1000:.2f} ms, "
+                f"was {before['latencyP99'] * 1000:.2f}"
+            )
+        if result.peak_memory > before["peakMemory"] * (1 + threshold):
+            regressions.append(
+                f"{result.name}: peak memory {result.peak_memory} bytes, "
+                f"was {before['peakMemory']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the REST client")
+    parser.add_argument(
+        "--url", help="URL of a running API Gateway; a mock is started if omitted"
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.005, help="mock latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock 503 rate")
+    parser.add_argument("--cameras", type=int, default=1000, help="mock cameras")
+    parser.add_argument("--json", help="file to save the results to")
+    parser.add_argument("--baseline", help="results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    mock = None
+    serverUrl = args.url
+    if serverUrl is None:
+        mock = MockApiGateway(
+            latency=args.latency, error_rate=args.error_rate, cameras=args.cameras
+        )
+        serverUrl = mock.start()
+    try:
+        results = run_benchmarks(serverUrl, args.requests, args.concurrency)
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    print(
+        f"{'scenario':<28} {'requests':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'peak KiB':>10}"
+    )
+    for result in results:
+        print(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([result.to_dict() for result in results], f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
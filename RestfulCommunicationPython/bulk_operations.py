@@ -0,0 +1,235 @@
+"""
+Bulk create, update and delete operations running concurrently through an AsyncGateway.
+"""
+import asyncio
+import json
+import time
+import aiohttp
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Tuple
+from async_api_gateway import AsyncGateway
+
+
+class BulkResult:
+    """
+    Class representing the outcome of one item of a bulk operation.
+    """
+
+    def __init__(
+        self, index: int, obj_id: str, status: int, data=None, error=None
+    ):
+        """Constructor
+
+        :param index: The position of the item in the input of the bulk operation
+        :param obj_id: The id of the item, if known
+        :param status: The HTTP status code, or None if no response was received
+        :param data: The parsed 'result' or 'data' of a successful response
+        :param error: The error of a failed response, or the exception raised
+        """
+        self.index = index
+        self.obj_id = obj_id
+        self.status = status
+        self.data = data
+        self.error = error
+
+    @property
+    def success(self) -> bool:
+        return self.status is not None and 200 <= self.status <= 299
+
+    def __repr__(self):
+        outcome = "ok" if self.success else f"failed: {self.error}"
+        return f"BulkResult(index={self.index}, id={self.obj_id}, status={self.status}, {outcome})"
+
+
+class BulkSummary:
+    """
+    Class representing the totals of a bulk operation.
+    """
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items completed per second."""
+        if self.elapsed == 0:
+            return 0.0
+        return (self.succeeded + self.failed) / self.elapsed
+
+    def __str__(self):
+        return (
+            f"{self.succeeded} succeeded, {self.failed} failed "
+            f"in {self.elapsed:.2f} seconds ({self.throughput:.1f} items/second)"
+        )
+
+
+class BulkOperation:
+    """
+    Class representing a bulk operation, iterated with 'async for' to receive a BulkResult per
+    item as soon as it completes.
+
+    The input is consumed lazily, and at most 'limit' items are in progress at the same time.
+    A failing item is reported in its BulkResult and does not stop the remaining items.
+    The totals are available in 'summary' once the iteration has finished.
+    """
+
+    def __init__(
+        self,
+        perform: Callable[[object], Awaitable[aiohttp.ClientResponse]],
+        items: Iterable,
+        limit: int,
+        id_of: Callable[[object], str] = None,
+    ):
+        """Constructor
+
+        :param perform: Coroutine function performing the request for one item
+        :param items: The items to process
+        :param limit: The maximum number of items in progress at the same time
+        :param id_of: Function returning the id of an item, if known before it is processed
+        """
+        self._perform = perform
+        self._items = items
+        self._limit = limit
+        self._id_of = id_of
+        self.summary = BulkSummary()
+
+    def __aiter__(self) -> AsyncIterator[BulkResult]:
+        return self.__run()
+
+    async def __run(self) -> AsyncIterator[BulkResult]:
+        start = time.perf_counter()
+        items = enumerate(self._items)
+        pending = set()
+        try:
+            while True:
+                for index, item in items:
+                    pending.add(asyncio.ensure_future(self.__process(index, item)))
+                    if len(pending) >= self._limit:
+                        break
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    result = task.result()
+                    if result.success:
+                        self.summary.succeeded += 1
+                    else:
+                        self.summary.failed += 1
+                    self.summary.elapsed = time.perf_counter() - start
+                    yield result
+        finally:
+            for task in pending:
+                task.cancel()
+            self.summary.elapsed = time.perf_counter() - start
+
+    async def __process(self, index: int, item) -> BulkResult:
+        obj_id = self._id_of(item) if self._id_of is not None else None
+        try:
+            response = await self._perform(item)
+            try:
+                body = await response.json(content_type=None)
+            except ValueError:
+                body = {}
+            if 200 <= response.status <= 299:
+                data = body.get("result", body.get("data")) if body else None
+                if obj_id is None and isinstance(data, dict):
+                    obj_id = data.get("id")
+                return BulkResult(index, obj_id, response.status, data=data)
+            error = body.get("error", body) if body else await response.text()
+            return BulkResult(index, obj_id, response.status, error=error)
+        except Exception as err:
+            # e.g. GatewayConnectionError; keep going with the next item
+            return BulkResult(index, obj_id, None, error=err)
+
+
+def create_items(
+    api_gateway: AsyncGateway,
+    session: aiohttp.ClientSession,
+    resource_plural: str,
+    payloads: Iterable,
+    token: str,
+    limit: int = 32,
+) -> BulkOperation:
+    """Creates items on the server concurrently.
+
+    :param api_gateway: The AsyncGateway to send the requests through
+    :param session: An aiohttp.ClientSession object shared by all calls
+    :param resource_plural: The name of the resource type of the items
+    :param payloads: JSON strings or dicts, one per item to create
+    :param token: The bearer access token to use
+    :param limit: The maximum number of items in progress at the same time
+
+    :returns: BulkOperation yielding a BulkResult per item
+    """
+
+    async def perform(payload):
+        return await api_gateway.create_item(
+            session, resource_plural, _to_json(payload), token
+        )
+
+    return BulkOperation(perform, payloads, limit)
+
+
+def update_items(
+    api_gateway: AsyncGateway,
+    session: aiohttp.ClientSession,
+    resource_plural: str,
+    items: Iterable[Tuple[str, object]],
+    token: str,
+    limit: int = 32,
+) -> BulkOperation:
+    """Updates items on the server concurrently.
+
+    :param api_gateway: The AsyncGateway to send the requests through
+    :param session: An aiohttp.ClientSession object shared by all calls
+    :param resource_plural: The name of the resource type of the items
+    :param items: Tuples of the id of an item and its payload as a JSON string or dict
+    :param token: The bearer access token to use
+    :param limit: The maximum number of items in progress at the same time
+
+    :returns: BulkOperation yielding a BulkResult per item
+    """
+
+    async def perform(item):
+        obj_id, payload = item
+        return await api_gateway.update_item(
+            session, resource_plural, _to_json(payload), obj_id, token
+        )
+
+    return BulkOperation(perform, items, limit, id_of=lambda item: item[0])
+
+
+def delete_items(
+    api_gateway: AsyncGateway,
+    session: aiohttp.ClientSession,
+    resource_plural: str,
+    obj_ids: Iterable[str],
+    token: str,
+    limit: int = 32,
+) -> BulkOperation:
+    """Deletes items on the server concurrently.
+
+    :param api_gateway: The AsyncGateway to send the requests through
+    :param session: An aiohttp.ClientSession object shared by all calls
+    :param resource_plural: The name of the resource type of the items
+    :param obj_ids: The ids of the items to delete
+    :param token: The bearer access token to use
+    :param limit: The maximum number of items in progress at the same time
+
+    :returns: BulkOperation yielding a BulkResult per item
+    """
+
+    async def perform(obj_id):
+        return await api_gateway.delete_item(session, resource_plural, obj_id, token)
+
+    return BulkOperation(perform, obj_ids, limit, id_of=lambda obj_id: obj_id)
+
+
+def _to_json(payload) -> str:
+    if isinstance(payload, str):
+        return payload
+    return json.dumps(payload)
@@ -0,0 +1,124 @@
+"""
+ConfigCrawler class used for reading the configuration hierarchy into a ConfigIndex.
+"""
+import asyncio
+import aiohttp
+from typing import Dict, Iterable
+from async_api_gateway import AsyncGateway
+from config_index import ConfigIndex
+from retry_policy import GatewayError
+
+# Child item types of hardware crawled by default
+HARDWARE_CHILD_TYPES = (
+    "cameras",
+    "microphones",
+    "speakers",
+    "metadata",
+    "inputEvents",
+    "outputs",
+)
+
+
+class ConfigCrawler:
+    """
+    Class crawling recording servers, their hardware, and the devices of the hardware.
+
+    The child items of all recording servers and all hardware are requested concurrently
+    through an AsyncGateway, which limits the number of requests in flight.
+
+    A crawl replaces the crawled types in the index as a whole: items that are no longer on
+    the server are removed, and if any request fails, the index is left as it was.
+    """
+
+    def __init__(
+        self,
+        api_gateway: AsyncGateway,
+        session: aiohttp.ClientSession,
+        token: str,
+        index: ConfigIndex,
+        child_types: Iterable[str] = HARDWARE_CHILD_TYPES,
+    ):
+        """Constructor
+
+        :param api_gateway: The AsyncGateway to send the requests through
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param token: The bearer access token to use
+        :param index: The ConfigIndex to store the items in
+        :param child_types: The child item types of hardware to crawl
+        """
+        self._api_gateway = api_gateway
+        self._session = session
+        self._token = token
+        self._index = index
+        self._child_types = child_types
+        self._counts = {}
+        self._seen = {}
+
+    async def crawl(self) -> Dict[str, int]:
+        """Crawls the configuration and stores all items found in the index.
+
+        :returns: dict with the number of items found per resource type
+        :raises GatewayError: If any request failed; nothing is changed in the index then
+        """
+        self._counts = {}
+        self._seen = {"recordingServers": set(), "hardware": set()}
+        self._seen.update({child_type: set() for child_type in self._child_types})
+        crawls = []
+        try:
+            recording_servers = [
+                server
+                async for server in self._api_gateway.get_paged(
+                    self._session, "recordingServers", self._token
+                )
+            ]
+            self.__store(recording_servers, "recordingServers", None)
+
+            crawls = [
+                asyncio.ensure_future(self.__crawl_recording_server(server))
+                for server in recording_servers
+            ]
+            await asyncio.gather(*crawls)
+        except BaseException:
+            for crawl in crawls:
+                crawl.cancel()
+            await asyncio.gather(*crawls, return_exceptions=True)
+            # Don't leave a partial crawl in the index
+            self._index.rollback()
+            raise
+
+        for item_type, ids in self._seen.items():
+            self._index.retain(item_type, ids)
+        self._index.commit()
+        return self._counts
+
+    async def __crawl_recording_server(self, server: dict):
+        hardware = await self.__get_children(
+            "recordingServers", server["id"], "hardware"
+        )
+        await asyncio.gather(
+            *[
+                self.__get_children("hardware", item["id"], child_type)
+                for item in hardware
+                for child_type in self._child_types
+            ]
+        )
+
+    async def __get_children(
+        self, resource_plural: str, obj_id: str, child_item_type: str
+    ) -> list:
+        response = await self._api_gateway.get_child_items(
+            self._session, resource_plural, obj_id, child_item_type, self._token
+        )
+        if response.status != 200:
+            raise GatewayError(
+                f"Unable to retrieve {child_item_type} of {resource_plural}/{obj_id}: "
+                f"status {response.status}"
+            )
+        items = (await response.json())["array"]
+        self.__store(items, child_item_type, obj_id)
+        return items
+
+    def __store(self, items: list, item_type: str, parent_id: str):
+        self._index.add(items, item_type, parent_id)
+        self._seen[item_type].update(item["id"] for item in items)
+        self._counts[item_type] = self._counts.get(item_type, 0) + len(items)
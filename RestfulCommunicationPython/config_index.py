@@ -0,0 +1,185 @@
+"""
+ConfigIndex class used for storing configuration items locally for fast lookups.
+"""
+import json
+import sqlite3
+from typing import Iterable, List
+
+
+class ConfigIndex:
+    """
+    Class representing a local, indexed store of configuration items backed by SQLite.
+
+    Items are returned as dicts with the keys 'id', 'name', 'type', 'parentId' and 'data',
+    where 'data' is the item as returned by the RESTful API.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        """Constructor
+
+        :param path: Path of the SQLite database file, or ":memory:" to keep it in memory only
+        """
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                type TEXT NOT NULL,
+                parent_id TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS items_name ON items (name);
+            CREATE INDEX IF NOT EXISTS items_type ON items (type);
+            CREATE INDEX IF NOT EXISTS items_parent_id ON items (parent_id);
+            """
+        )
+
+    def add(self, items: Iterable[dict], item_type: str, parent_id: str = None):
+        """Adds or replaces items.
+
+        :param items: The items as returned by the RESTful API
+        :param item_type: The resource type of the items, e.g. cameras
+        :param parent_id: The id of the parent of the items. If None, the parent is taken from
+            the 'relations' of each item, if present.
+        """
+        rows = []
+        for item in items:
+            item_parent_id = parent_id
+            if item_parent_id is None:
+                item_parent_id = item.get("relations", {}).get("parent", {}).get("id")
+            name = item.get("displayName", item.get("name"))
+            rows.append((item["id"], name, item_type, item_parent_id, json.dumps(item)))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO items (id, name, type, parent_id, data) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def remove(self, obj_id: str):
+        """Removes an item.
+
+        :param obj_id: The id of the item to remove
+        """
+        self._db.execute("DELETE FROM items WHERE id = ?", (obj_id,))
+
+    def retain(self, item_type: str, ids: Iterable[str]):
+        """Removes the items of a type whose ids are not given, e.g. after the type was read
+        again from the server.
+
+        :param item_type: The resource type of the items, e.g. cameras
+        :param ids: The ids of the items to keep
+        """
+        ids = set(ids)
+        stale = [
+            (obj_id,)
+            for (obj_id,) in self._db.execute(
+                "SELECT id FROM items WHERE type = ?", (item_type,)
+            )
+            if obj_id not in ids
+        ]
+        self._db.executemany("DELETE FROM items WHERE id = ?", stale)
+
+    def commit(self):
+        """Writes pending changes to the database file."""
+        self._db.commit()
+
+    def rollback(self):
+        """Discards the changes made since the last commit."""
+        self._db.rollback()
+
+    def clear(self):
+        """Removes all items."""
+        self._db.execute("DELETE FROM items")
+
+    def close(self):
+        """Commits pending changes and closes the database."""
+        self._db.commit()
+        self._db.close()
+
+    def get(self, obj_id: str) -> dict:
+        """Looks up an item by id.
+
+        :param obj_id: The id of the item
+
+        :returns: The item, or None if it isn't in the index
+        """
+        rows = self.__query("WHERE id = ?", obj_id)
+        return rows[0] if rows else None
+
+    def find_by_name(self, name: str, item_type: str = None) -> List[dict]:
+        """Looks up items by name.
+
+        :param name: The name of the items
+        :param item_type: Optional resource type of the items
+
+        :returns: List of items
+        """
+        if item_type is None:
+            return self.__query("WHERE name = ?", name)
+        return self.__query("WHERE name = ? AND type = ?", name, item_type)
+
+    def find_by_type(self, item_type: str) -> List[dict]:
+        """Looks up all items of a resource type.
+
+        :param item_type: The resource type of the items, e.g. cameras
+
+        :returns: List of items
+        """
+        return self.__query("WHERE type = ?", item_type)
+
+    def children(self, parent_id: str, item_type: str = None) -> List[dict]:
+        """Looks up the child items of an item.
+
+        :param parent_id: The id of the parent item
+        :param item_type: Optional resource type of the child items
+
+        :returns: List of items
+        """
+        if item_type is None:
+            return self.__query("WHERE parent_id = ?", parent_id)
+        return self.__query("WHERE parent_id = ? AND type = ?", parent_id, item_type)
+
+    def parent(self, obj_id: str) -> dict:
+        """Looks up the parent of an item, e.g. the hardware a camera belongs to.
+
+        :param obj_id: The id of the item
+
+        :returns: The parent item, or None if it isn't in the index
+        """
+        rows = self.__query(
+            "WHERE id = (SELECT parent_id FROM items WHERE id = ?)", obj_id
+        )
+        return rows[0] if rows else None
+
+    def ancestors(self, obj_id: str) -> List[dict]:
+        """Looks up the chain of parents of an item, nearest first.
+
+        :param obj_id: The id of the item
+
+        :returns: List of items, e.g. [hardware, recording server] for a camera
+        """
+        result = []
+        item = self.parent(obj_id)
+        while item is not None:
+            result.append(item)
+            item = self.parent(item["id"])
+        return result
+
+    def count(self) -> int:
+        """Returns the number of items in the index."""
+        return self._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def __query(self, where: str, *args) -> List[dict]:
+        cursor = self._db.execute(
+            "SELECT id, name, type, parent_id, data FROM items " + where, args
+        )
+        return [
+            {
+                "id": row[0],
+                "name": row[1],
+                "type": row[2],
+                "parentId": row[3],
+                "data": json.loads(row[4]),
+            }
+            for row in cursor
+        ]
@@ -0,0 +1,247 @@
+"""
+Snapshots of configuration, and reconciliation of the live configuration with a desired state.
+
+A snapshot or desired state is a dict mapping resource types to their items, e.g.
+{"userDefinedEvents": {"<id>": {"id": "<id>", "name": "Door opened"}}}. In a desired state
+file, the items of a resource type may also be given as a list, and items without an id are
+matched with live items by name.
+"""
+import asyncio
+import json
+import aiohttp
+from typing import Dict, Iterable, List
+from async_api_gateway import AsyncGateway
+from config_index import ConfigIndex
+import bulk_operations
+
+# Fields that are maintained by the server and never sent in an update
+IGNORED_FIELDS = ("id", "displayName", "relations", "lastModified")
+
+
+class Change:
+    """
+    Class representing a single create, update or delete needed to reach the desired state.
+    """
+
+    def __init__(self, action: str, resource_plural: str, obj_id: str, payload: dict):
+        """Constructor
+
+        :param action: "create", "update" or "delete"
+        :param resource_plural: The name of the resource type of the item
+        :param obj_id: The id of the item, or None if it is created without an id
+        :param payload: The fields to send; for an update only the fields that differ
+        """
+        self.action = action
+        self.resource_plural = resource_plural
+        self.obj_id = obj_id
+        self.payload = payload
+
+    def __repr__(self):
+        return f"Change({self.action} {self.resource_plural}/{self.obj_id}: {self.payload})"
+
+
+async def take_snapshot(
+    api_gateway: AsyncGateway,
+    session: aiohttp.ClientSession,
+    token: str,
+    resource_types: Iterable[str],
+) -> Dict[str, Dict[str, dict]]:
+    """Reads all items of the given resource types from the server concurrently.
+
+    :param api_gateway: The AsyncGateway to send the requests through
+    :param session: An aiohttp.ClientSession object shared by all calls
+    :param token: The bearer access token to use
+    :param resource_types: The names of the resource types, e.g. ["userDefinedEvents", "rules"]
+
+    :returns: Snapshot of the items per resource type
+    :raises GatewayError: If any page can't be retrieved; a partial snapshot is never returned
+    """
+
+    async def read(resource_plural):
+        items = {}
+        async for item in api_gateway.get_paged(session, resource_plural, token):
+            items[item["id"]] = item
+        return items
+
+    resource_types = list(resource_types)
+    reads = [asyncio.ensure_future(read(r)) for r in resource_types]
+    try:
+        results = await asyncio.gather(*reads)
+    except BaseException:
+        # Stop reading the other resource types, the snapshot is abandoned anyway
+        for task in reads:
+            task.cancel()
+        await asyncio.gather(*reads, return_exceptions=True)
+        raise
+    return dict(zip(resource_types, results))
+
+
+def snapshot_from_index(
+    index: ConfigIndex, resource_types: Iterable[str]
+) -> Dict[str, Dict[str, dict]]:
+    """Builds a snapshot from the items in a ConfigIndex, e.g. after a ConfigCrawler crawl.
+
+    :param index: The ConfigIndex holding the items
+    :param resource_types: The names of the resource types to include
+
+    :returns: Snapshot of the items per resource type
+    """
+    return {
+        resource_plural: {
+            item["id"]: item["data"] for item in index.find_by_type(resource_plural)
+        }
+        for resource_plural in resource_types
+    }
+
+
+def save_snapshot(snapshot: Dict[str, Dict[str, dict]], path: str):
+    """Writes a snapshot to a JSON file."""
+    with open(path, "w") as f:
+        json.dump(snapshot, f, indent=2)
+
+
+def load_snapshot(path: str) -> Dict[str, Dict[str, dict]]:
+    """Reads a snapshot or desired state from a JSON file.
+
+    Items given as a list are keyed by their id. Items without an id are keyed by their
+    position in the list, prefixed by "new:".
+    """
+    with open(path, "r") as f:
+        state = json.load(f)
+
+    snapshot = {}
+    for resource_plural, items in state.items():
+        if isinstance(items, dict):
+            snapshot[resource_plural] = items
+        else:
+            snapshot[resource_plural] = {
+                item.get("id", f"new:{position}"): item
+                for position, item in enumerate(items)
+            }
+    return snapshot
+
+
+def diff(
+    desired: Dict[str, Dict[str, dict]],
+    live: Dict[str, Dict[str, dict]],
+    prune: bool = False,
+) -> List[Change]:
+    """Computes the changes needed to turn the live state into the desired state.
+
+    Only the resource types present in the desired state are compared, and only the fields
+    present in a desired item are compared with the live item. A desired item without an id
+    is matched with the live item of the same name, and created if there is none.
+
+    :param desired: The desired state
+    :param live: The live state, e.g. a fresh snapshot
+    :param prune: Whether to delete live items that are missing from the desired state
+
+    :returns: List of changes; creates first, then updates, then deletes
+    :raises ValueError: If a resource type of the desired state is missing from the live state,
+        as diffing against an incomplete snapshot would create duplicates of existing items
+    """
+    missing = [r for r in desired if r not in live]
+    if missing:
+        raise ValueError(f"The live state has no snapshot of {', '.join(missing)}")
+
+    creates, updates, deletes = [], [], []
+    for resource_plural, desired_items in desired.items():
+        live_items = live[resource_plural]
+        live_by_name = {item.get("name"): item for item in live_items.values()}
+        matched_ids = set()
+        for desired_item in desired_items.values():
+            obj_id = desired_item.get("id")
+            if obj_id is None:
+                live_item = live_by_name.get(desired_item.get("name"))
+                obj_id = live_item["id"] if live_item is not None else None
+            else:
+                live_item = live_items.get(obj_id)
+            matched_ids.add(obj_id)
+            if live_item is None:
+                payload = {k: v for k, v in desired_item.items() if k != "relations"}
+                creates.append(Change("create", resource_plural, obj_id, payload))
+                continue
+
+            payload = {
+                field: value
+                for field, value in desired_item.items()
+                if field not in IGNORED_FIELDS and live_item.get(field) != value
+            }
+            if payload:
+                updates.append(Change("update", resource_plural, obj_id, payload))
+
+        if prune:
+            for obj_id in live_items:
+                if obj_id not in matched_ids:
+                    deletes.append(Change("delete", resource_plural, obj_id, None))
+
+    return creates + updates + deletes
+
+
+async def apply_changes(
+    api_gateway: AsyncGateway,
+    session: aiohttp.ClientSession,
+    token: str,
+    changes: List[Change],
+    limit: int = 32,
+) -> List[bulk_operations.BulkResult]:
+    """Applies changes using concurrent bulk operations.
+
+    All creates are applied first, then all updates, then all deletes. Within each step,
+    the changes of all resource types are applied concurrently.
+
+    :param api_gateway: The AsyncGateway to send the requests through
+    :param session: An aiohttp.ClientSession object shared by all calls
+    :param token: The bearer access token to use
+    :param changes: The changes to apply, e.g. as returned by diff()
+    :param limit: The maximum number of changes in progress per resource type and step
+
+    :returns: List of the failed results; empty if all changes were applied
+    """
+    failures = []
+
+    async def run(operation: bulk_operations.BulkOperation, action: str, resource):
+        async for result in operation:
+            if not result.success:
+                failures.append(result)
+        print(f"{action} {resource}: {operation.summary}")
+
+    for action in ("create", "update", "delete"):
+        by_resource = {}
+        for change in changes:
+            if change.action == action:
+                by_resource.setdefault(change.resource_plural, []).append(change)
+
+        operations = []
+        for resource_plural, resource_changes in by_resource.items():
+            if action == "create":
+                operation = bulk_operations.create_items(
+                    api_gateway,
+                    session,
+                    resource_plural,
+                    [c.payload for c in resource_changes],
+                    token,
+                    limit,
+                )
+            elif action == "update":
+                operation = bulk_operations.update_items(
+                    api_gateway,
+                    session,
+                    resource_plural,
+                    [(c.obj_id, c.payload) for c in resource_changes],
+                    token,
+                    limit,
+                )
+            else:
+                operation = bulk_operations.delete_items(
+                    api_gateway,
+                    session,
+                    resource_plural,
+                    [c.obj_id for c in resource_changes],
+                    token,
+                    limit,
+                )
+            operations.append(run(operation, action, resource_plural))
+        await asyncio.gather(*operations)
+
+    return failures
@@ -0,0 +1,203 @@
+"""
+FleetTaskRunner class used for running a task on many items at once.
+"""
+import asyncio
+import json
+import time
+import aiohttp
+from typing import Dict, Iterable, Tuple, Union
+from async_api_gateway import AsyncGateway
+from retry_policy import GatewayError
+from task_catalog import TaskCatalog
+from task_tracker import TaskTracker
+
+
+async def get_recording_servers(
+    api_gateway: AsyncGateway,
+    session: aiohttp.ClientSession,
+    resource_plural: str,
+    token: str,
+) -> Dict[str, str]:
+    """Finds the recording server of every item of a hardware child type.
+
+    :param api_gateway: The AsyncGateway to send the requests through
+    :param session: An aiohttp.ClientSession object shared by all calls
+    :param resource_plural: The name of a resource type whose parent is hardware, e.g. cameras
+    :param token: The bearer access token to use
+
+    :returns: dict mapping the id of each item to the id of its recording server
+    """
+    hardware_servers = {}
+    async for hardware in api_gateway.get_paged(session, "hardware", token):
+        hardware_servers[hardware["id"]] = hardware["relations"]["parent"]["id"]
+
+    item_servers = {}
+    async for item in api_gateway.get_paged(session, resource_plural, token):
+        hardware_id = item["relations"]["parent"]["id"]
+        item_servers[item["id"]] = hardware_servers.get(hardware_id)
+    return item_servers
+
+
+class FleetTaskRunner:
+    """
+    Class running a named task on many items of the same resource type.
+
+    For each item, the runner checks that the task is available, starts it, and waits for
+    it to finish using a TaskTracker. The available tasks are looked up in a TaskCatalog,
+    so the server is only asked once per type rather than once per item. If the catalog
+    can't tell, e.g. because the server didn't answer, the task is tried anyway. An item
+    lacking a task its type offers, e.g. a camera without PTZ, fails when the task is
+    started. At most max_concurrency items are in progress in total, and at most
+    max_per_server items on the same recording server, as the tasks are performed by the
+    recording servers. Each result is appended to a JSONL file as soon as it is known.
+    """
+
+    def __init__(
+        self,
+        api_gateway: AsyncGateway,
+        session: aiohttp.ClientSession,
+        token: str,
+        task: str,
+        child_item_type: str = None,
+        payload: str = '{"sessionDataId": 0}',
+        max_concurrency: int = 64,
+        max_per_server: int = 8,
+        task_catalog: TaskCatalog = None,
+    ):
+        """Constructor
+
+        :param api_gateway: The AsyncGateway to send the requests through
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param token: The bearer access token to use
+        :param task: The id of the task to perform, e.g. GetDevicePresets
+        :param child_item_type: The child item type on which to perform the task, e.g.
+            ptzpresets, or None to perform the task on the items themselves
+        :param payload: JSON string representation of the request body
+        :param max_concurrency: The maximum number of items in progress in total
+        :param max_per_server: The maximum number of items in progress per recording server
+        :param task_catalog: Optional TaskCatalog shared with other runs. By default, a new
+            catalog is used.
+        """
+        self._api_gateway = api_gateway
+        self._session = session
+        self._token = token
+        self._task = task
+        self._child_item_type = child_item_type
+        self._payload = payload
+        self._max_concurrency = max_concurrency
+        self._max_per_server = max_per_server
+        self._task_catalog = task_catalog if task_catalog is not None else TaskCatalog()
+
+    async def run(
+        self,
+        resource_plural: str,
+        items: Iterable[Union[str, Tuple[str, str]]],
+        output_path: str,
+    ) -> Dict[str, int]:
+        """Runs the task on all items.
+
+        Each line written to output_path is a JSON object with the 'id' and
+        'recordingServer' of the item, the 'status' (the task state "Success" or "Error",
+        "Unsupported" if the catalog doesn't list the task for the type, or "Failed" if the
+        task could not be started), the task data or error as 'result', and the number of
+        seconds it took as 'elapsed', not counting the time the item waited for its turn.
+
+        :param resource_plural: The name of the resource type of the items, e.g. cameras
+        :param items: Item ids, or tuples of an item id and the id of its recording server
+            (see get_recording_servers)
+        :param output_path: Path of the JSONL file to append the results to
+
+        :returns: dict with the number of items per status
+        """
+        tracker = TaskTracker(self._api_gateway, self._session, self._token)
+        global_limit = asyncio.Semaphore(self._max_concurrency)
+        server_limits = {}
+        item_tasks = []
+        counts = {}
+
+        with open(output_path, "a") as output:
+
+            async def process(obj_id: str, server_id: str):
+                if server_id not in server_limits:
+                    server_limits[server_id] = asyncio.Semaphore(self._max_per_server)
+                async with server_limits[server_id], global_limit:
+                    # Timed from here, so waiting for a free slot isn't counted
+                    start = time.perf_counter()
+                    try:
+                        status, result = await self.__process(
+                            tracker, resource_plural, obj_id
+                        )
+                    except Exception as err:
+                        status, result = "Failed", str(err)
+                    elapsed = time.perf_counter() - start
+                record = {
+                    "id": obj_id,
+                    "recordingServer": server_id,
+                    "status": status,
+                    "result": result,
+                    "elapsed": round(elapsed, 3),
+                }
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                counts[status] = counts.get(status, 0) + 1
+
+            for item in items:
+                obj_id, server_id = item if isinstance(item, tuple) else (item, None)
+                item_tasks.append(asyncio.ensure_future(process(obj_id, server_id)))
+            await asyncio.gather(*item_tasks)
+
+        # Let the tracker finish cleaning up the last tasks
+        await tracker.wait_all()
+
+        return counts
+
+    async def __process(self, tracker: TaskTracker, resource_plural: str, obj_id: str):
+        """Checks, starts and waits for the task on one item.
+
+        :returns: Tuple of the status and the task data or error
+        """
+        if await self.__is_listed(resource_plural, obj_id) is False:
+            return "Unsupported", None
+
+        if self._child_item_type is None:
+            response = await self._api_gateway.perform_task(
+                self._session,
+                resource_plural,
+                obj_id,
+                self._task,
+                self._payload,
+                self._token,
+            )
+        else:
+            response = await self._api_gateway.perform_child_task(
+                self._session,
+                resource_plural,
+                obj_id,
+                self._child_item_type,
+                self._task,
+                self._payload,
+                self._token,
+            )
+        body = await response.json(content_type=None) or {}
+        if response.status != 200:
+            return "Failed", body.get("error", response.status)
+
+        task_data = await tracker.track(body["result"]["path"]["id"])
+        return task_data["state"], task_data
+
+    async def __is_listed(self, resource_plural: str, obj_id: str):
+        """Whether the catalog lists the task for the type, or None if it can't tell"""
+        try:
+            tasks = await self._task_catalog.get_tasks_async(
+                self._api_gateway,
+                self._session,
+                self._token,
+                resource_plural,
+                obj_id,
+                self._child_item_type,
+            )
+        except GatewayError:
+            return None
+        if not tasks:
+            return None
+        return any(task["id"] == self._task for task in tasks)
@@ -0,0 +1,396 @@
+"""
+Local stand-in for the API Gateway, used for running and measuring the sample without an
+XProtect server.
+
+Start it with e.g. "python mock_api_gateway.py --port 8080 --latency 0.02", and use
+http://localhost:8080 as serverUrl with any username and password.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import uuid
+from aiohttp import web
+
+# Tasks offered per resource type, as listed by "?tasks"
+DEFAULT_TASKS = {
+    "hardware": ["ReadPasswordHardware", "UpdateFirmwareHardware"],
+    "ptzpresets": ["GetDevicePresets"],
+    "recordingServers": ["ChangeSecurityPermissions"],
+    "tasks": ["TaskCleanup"],
+}
+
+# Resource types whose items are created asynchronously by the server
+ACCEPTED_TYPES = ("alarms", "events")
+
+
+class MockApiGateway:
+    """
+    Class representing a local API Gateway with generated configuration, events and alarms.
+
+    It implements the identity provider token endpoints, and the RESTful API for listing
+    (with paging), reading, creating, updating and deleting items, child items, and listing,
+    invoking and polling tasks. Responses carry an ETag, and conditional requests are answered
+    with 304 Not Modified.
+
+    Only tokens issued by the server are accepted. Windows authentication isn't checked.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        cameras: int = 1000,
+        cameras_per_hardware: int = 4,
+        recording_servers: int = 4,
+        events: int = 1000,
+        alarms: int = 1000,
+        task_polls: int = 3,
+        seed: int = 0,
+    ):
+        """Constructor
+
+        :param latency: Seconds added to every response
+        :param error_rate: Fraction of REST requests answered with 503 Service Unavailable
+        :param cameras: The number of cameras
+        :param cameras_per_hardware: The number of cameras per hardware
+        :param recording_servers: The number of recording servers the hardware is spread over
+        :param events: The number of stored events
+        :param alarms: The number of stored alarms
+        :param task_polls: The number of times a task is polled before it succeeds
+        :param seed: Seed of the random errors
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.task_polls = task_polls
+        self.tasks = DEFAULT_TASKS
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._tokens = set()
+        self._running_tasks = {}
+        self._items = self.__generate(
+            cameras, cameras_per_hardware, recording_servers, events, alarms
+        )
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def app(self) -> web.Application:
+        """Returns the aiohttp application serving the API Gateway."""
+        app = web.Application()
+        app.router.add_post("/API/IDP/connect/token", self.__token)
+        app.router.add_post("/IDP/connect/token", self.__token)
+        app.router.add_route("*", "/api/rest/v1/{path:.*}", self.__rest)
+        return app
+
+    def run(self, port: int = 8080, host: str = "127.0.0.1"):
+        """Serves the API Gateway until interrupted."""
+        web.run_app(self.app(), host=host, port=port)
+
+    def start(self, port: int = 0, host: str = "127.0.0.1") -> str:
+        """Serves the API Gateway on a background thread until stop() is called.
+
+        :param port: The port to listen on, or 0 to pick a free port
+
+        :returns: The URL of the server, to be used as serverUrl
+        """
+        started = threading.Event()
+        address = []
+
+        async def serve():
+            self._runner = web.AppRunner(self.app())
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, host, port)
+            await site.start()
+            address.append(self._runner.addresses[0])
+            started.set()
+
+        def run_loop():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run_loop, daemon=True)
+        self._thread.start()
+        started.wait()
+        return f"http://{address[0][0]}:{address[0][1]}"
+
+    def stop(self):
+        """Stops a server started by start()."""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def __token(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        form = await request.post()
+        if request.path.startswith("/API/") and not (
+            form.get("grant_type") == "password"
+            and form.get("username")
+            and form.get("password")
+        ):
+            return web.json_response({"error": "invalid_grant"}, status=400)
+        token = uuid.uuid4().hex
+        self._tokens.add(token)
+        return web.json_response(
+            {"access_token": token, "expires_in": 3600, "token_type": "Bearer"}
+        )
+
+    async def __rest(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        authorization = request.headers.get("Authorization", "")
+        if authorization[len("Bearer ") :] not in self._tokens:
+            return self.__error(401, "Unauthorized")
+        if self.error_rate and self._random.random() < self.error_rate:
+            response = self.__error(503, "Service Unavailable")
+            response.headers["Retry-After"] = "0"
+            return response
+
+        parts = request.match_info["path"].strip("/").split("/")
+        if len(parts) not in (1, 2, 3, 4):
+            return self.__error(404, "Not Found")
+        query = request.query
+        if request.method == "GET" and "tasks" in query:
+            return self.__list_tasks(parts)
+        if request.method == "POST" and "task" in query:
+            return await self.__start_task(request, parts, query["task"])
+        if request.method == "GET":
+            return self.__get(request, parts)
+        if request.method == "POST" and len(parts) == 1:
+            return await self.__create(request, parts[0])
+        if request.method in ("PUT", "PATCH") and len(parts) == 2:
+            return await self.__update(request, parts[0], parts[1])
+        if request.method == "DELETE" and len(parts) == 2:
+            return self.__delete(parts[0], parts[1])
+        return self.__error(405, "Method Not Allowed")
+
+    def __get(self, request: web.Request, parts: list) -> web.Response:
+        if len(parts) == 2 and parts[0] == "tasks":
+            return self.__poll_task(parts[1])
+        if len(parts) in (1, 3):
+            items = self._items.get(parts[-1], {}).values()
+            if len(parts) == 3:
+                items = [item for item in items if _parent_id(item) == parts[1]]
+            items = list(items)
+            if "page" in request.query:
+                page = int(request.query["page"])
+                size = int(request.query.get("size", 100))
+                items = items[page * size : (page + 1) * size]
+            if "data" not in request.query.get("include", ""):
+                items = [_without_data(item) for item in items]
+            return self.__json(request, {"array": items})
+
+        item = self._items.get(parts[-2], {}).get(parts[-1])
+        if item is None:
+            return self.__error(404, "Not Found")
+        return self.__json(request, {"data": item})
+
+    async def __create(self, request: web.Request, resource_plural: str) -> web.Response:
+        item = await request.json()
+        item.setdefault("id", str(uuid.uuid4()))
+        item.setdefault("displayName", item.get("name", ""))
+        self._items.setdefault(resource_plural, {})[item["id"]] = item
+        if resource_plural in ACCEPTED_TYPES:
+            return web.json_response({"data": item}, status=202)
+        return web.json_response({"result": item}, status=201)
+
+    async def __update(
+        self, request: web.Request, resource_plural: str, obj_id: str
+    ) -> web.Response:
+        item = self._items.get(resource_plural, {}).get(obj_id)
+        if item is None:
+            return self.__error(404, "Not Found")
+        item.update(await request.json())
+        item["id"] = obj_id
+        status = 202 if resource_plural in ACCEPTED_TYPES else 200
+        return web.json_response({"data": item}, status=status)
+
+    def __delete(self, resource_plural: str, obj_id: str) -> web.Response:
+        if self._items.get(resource_plural, {}).pop(obj_id, None) is None:
+            return self.__error(404, "Not Found")
+        return web.json_response({"state": "Success"})
+
+    def __list_tasks(self, parts: list) -> web.Response:
+        resource_plural = parts[2] if len(parts) >= 3 else parts[0]
+        tasks = [
+            {"id": task, "displayName": task}
+            for task in self.tasks.get(resource_plural, [])
+        ]
+        return web.json_response({"tasks": tasks})
+
+    async def __start_task(
+        self, request: web.Request, parts: list, task: str
+    ) -> web.Response:
+        resource_plural = parts[2] if len(parts) >= 3 else parts[0]
+        if task not in self.tasks.get(resource_plural, []):
+            return self.__error(400, f"Task {task} not supported on {resource_plural}")
+        if task == "TaskCleanup":
+            self._running_tasks.pop(parts[1], None)
+            return web.json_response({"result": {"state": "Success"}})
+        task_id = str(uuid.uuid4())
+        self._running_tasks[task_id] = {"task": task, "polls": 0}
+        return web.json_response(
+            {
+                "result": {
+                    "path": {"type": "tasks", "id": task_id},
+                    "state": "InProgress",
+                }
+            }
+        )
+
+    def __poll_task(self, task_id: str) -> web.Response:
+        running = self._running_tasks.get(task_id)
+        if running is None:
+            return self.__error(404, "Not Found")
+        running["polls"] += 1
+        done = running["polls"] >= self.task_polls
+        data = {
+            "id": task_id,
+            "displayName": running["task"],
+            "state": "Success" if done else "InProgress",
+            "progress": 100 if done else 100 * running["polls"] // self.task_polls,
+        }
+        if done:
+            data["result"] = {"presets": []}
+        return web.json_response({"data": data})
+
+    def __json(self, request: web.Request, body: dict) -> web.Response:
+        text = json.dumps(body)
+        etag = '"' + hashlib.md5(text.encode()).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            text=text, content_type="application/json", headers={"ETag": etag}
+        )
+
+    def __error(self, status: int, message: str) -> web.Response:
+        return web.json_response(
+            {"error": {"httpCode": status, "details": [{"errorText": message}]}},
+            status=status,
+        )
+
+    def __generate(
+        self,
+        cameras: int,
+        cameras_per_hardware: int,
+        recording_servers: int,
+        events: int,
+        alarms: int,
+    ) -> dict:
+        def new_id(kind: int, number: int) -> str:
+            return str(uuid.UUID(int=(kind << 64) | number))
+
+        def item(kind, number, name, parent_type=None, parent_id=None, **fields):
+            result = {"id": new_id(kind, number), "name": name, "displayName": name}
+            if parent_type is not None:
+                result["relations"] = {"parent": {"type": parent_type, "id": parent_id}}
+            result.update(fields)
+            return result
+
+        site = item(1, 0, "Site", version="23.2.0.1")
+        items = {
+            "sites": [site],
+            "recordingServers": [
+                item(2, i, f"Recording Server {i}", "sites", site["id"])
+                for i in range(recording_servers)
+            ],
+        }
+        hardware_count = -(-cameras // cameras_per_hardware)
+        items["hardware"] = [
+            item(
+                3,
+                i,
+                f"Hardware {i}",
+                "recordingServers",
+                items["recordingServers"][i % recording_servers]["id"],
+                address=f"http://10.0.{i // 250}.{i % 250}/",
+            )
+            for i in range(hardware_count)
+        ]
+        items["cameras"] = [
+            item(
+                4,
+                i,
+                f"Camera {i}",
+                "hardware",
+                items["hardware"][i // cameras_per_hardware]["id"],
+                enabled=True,
+                channel=i % cameras_per_hardware,
+                description=f"Generated camera number {i}",
+                recordingFramerate=5.0,
+                shortName=f"C{i}",
+            )
+            for i in range(cameras)
+        ]
+        items["userDefinedEvents"] = [
+            item(5, i, f"User-defined Event {i}", subtype="UserDefined")
+            for i in range(3)
+        ]
+        items["rules"] = [item(6, i, f"Rule {i}", enabled=True) for i in range(2)]
+        items["alarmStates"] = [
+            item(7, i, name)
+            for i, name in enumerate(["New", "In progress", "On hold", "Closed"])
+        ]
+        items["alarmPriorities"] = [
+            item(8, i, name) for i, name in enumerate(["High", "Medium", "Low"])
+        ]
+        items["events"] = [
+            {
+                "id": new_id(9, i),
+                "time": f"2024-01-01T00:{i // 60 % 60:02}:{i % 60:02}.000Z",
+                "type": items["userDefinedEvents"][i % 3]["id"],
+                "source": items["cameras"][i % cameras]["id"] if cameras else None,
+                "data": {"tags": [f"tag{i % 10}"], "vendor": {"name": "Mock"}},
+            }
+            for i in range(events)
+        ]
+        items["alarms"] = [
+            {
+                "id": new_id(10, i),
+                "name": f"Alarm {i}",
+                "message": f"Alarm message {i}",
+                "source": items["cameras"][i % cameras]["id"] if cameras else None,
+                "state": items["alarmStates"][0]["id"],
+                "priority": items["alarmPriorities"][i % 3]["id"],
+                "data": {"objects": [{"name": "person", "confidence": 0.9}]},
+            }
+            for i in range(alarms)
+        ]
+        return {
+            resource_plural: {entry["id"]: entry for entry in entries}
+            for resource_plural, entries in items.items()
+        }
+
+
+def _parent_id(item: dict) -> str:
+    return item.get("relations", {}).get("parent", {}).get("id")
+
+
+def _without_data(item: dict) -> dict:
+    if "data" not in item:
+        return item
+    return {key: value for key, value in item.items() if key != "data"}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the API Gateway")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of 503 responses"
+    )
+    parser.add_argument("--cameras", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--alarms", type=int, default=1000)
+    args = parser.parse_args()
+    MockApiGateway(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        cameras=args.cameras,
+        events=args.events,
+        alarms=args.alarms,
+    ).run(port=args.port)
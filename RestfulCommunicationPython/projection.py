@@ -0,0 +1,159 @@
+"""
+Projection class used for decoding only the needed fields of large REST responses.
+"""
+import json
+import threading
+import time
+from typing import Any, Iterable, List, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _decoder_name() -> str:
+    if msgspec is not None:
+        return "msgspec"
+    if orjson is not None:
+        return "orjson"
+    return "json"
+
+
+def _loads(body: Union[bytes, str]):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _slotted_class(fields: tuple) -> type:
+    def __init__(self, data: dict):
+        for field in fields:
+            setattr(self, field, data.get(field))
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in fields)
+        return f"Item({values})"
+
+    return type(
+        "Item", (), {"__slots__": fields, "__init__": __init__, "__repr__": __repr__}
+    )
+
+
+class Projection:
+    """
+    Class decoding only the given fields of the items in a REST response.
+
+    Items are returned as objects with one attribute per field, e.g. item.displayName, using
+    __slots__ instead of a dict per item. A field missing from an item is None.
+
+    With the msgspec package installed, the fields are decoded straight into typed structs
+    and the rest of each item is skipped without being decoded. Otherwise, the body is parsed
+    with orjson, or the json module if orjson isn't installed either, and the fields are
+    copied out of the parsed items.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        """Constructor
+
+        :param fields: The names of the fields to decode, e.g. ["id", "displayName"]
+        """
+        self.fields = tuple(fields)
+        self.decoder = _decoder_name()
+        if msgspec is not None:
+            item_type = msgspec.defstruct(
+                "Item", [(field, Any, None) for field in self.fields]
+            )
+            self._list_decoder = msgspec.json.Decoder(
+                msgspec.defstruct("Page", [("array", List[item_type], [])])
+            )
+            self._single_decoder = msgspec.json.Decoder(
+                msgspec.defstruct("Single", [("data", item_type, None)])
+            )
+        else:
+            self._item_type = _slotted_class(self.fields)
+        self._lock = threading.Lock()
+        self.items = 0
+        self.parse_time = 0.0
+
+    def decode(self, body: Union[bytes, str]) -> list:
+        """Decodes the items of a list response, e.g. the body of a Gateway.get() response.
+
+        :param body: The response body as bytes or str, e.g. response.content, or
+            await response.text() of an AsyncGateway response
+        :returns: List of items
+        """
+        start = time.perf_counter()
+        if msgspec is not None:
+            items = self._list_decoder.decode(body).array
+        else:
+            items = [self._item_type(item) for item in _loads(body)["array"]]
+        self.__count(len(items), time.perf_counter() - start)
+        return items
+
+    def decode_single(self, body: Union[bytes, str]):
+        """Decodes the item of a single item response, e.g. the body of a
+        Gateway.get_single() response.
+
+        :param body: The response body as bytes or str, e.g. response.content
+        :returns: The item
+        """
+        start = time.perf_counter()
+        if msgspec is not None:
+            item = self._single_decoder.decode(body).data
+        else:
+            item = self._item_type(_loads(body)["data"])
+        self.__count(1, time.perf_counter() - start)
+        return item
+
+    def to_dict(self, item) -> dict:
+        """Converts a decoded item to a dict, e.g. for json.dumps()."""
+        return {field: getattr(item, field) for field in self.fields}
+
+    def stats(self) -> dict:
+        """Returns the number of items decoded and the seconds spent decoding them."""
+        with self._lock:
+            return {
+                "decoder": self.decoder,
+                "items": self.items,
+                "parseTime": self.parse_time,
+            }
+
+    def __count(self, items: int, elapsed: float):
+        with self._lock:
+            self.items += items
+            self.parse_time += elapsed
+
+
+def compare_parse_time(body: bytes, fields: Iterable[str], repeat: int = 5) -> dict:
+    """Measures the parse time saved by decoding only the given fields of a list response,
+    compared with parsing the whole body with the json module like response.json() does.
+
+    :param body: The body of a list response, e.g. response.content
+    :param fields: The names of the fields to decode
+    :param repeat: The number of times to parse the body; the fastest time is reported
+
+    :returns: dict with the seconds of a full parse and of a projected parse, and the seconds
+        saved per parse
+    """
+    projection = Projection(fields)
+    full, projected = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        json.loads(body)
+        full.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        projection.decode(body)
+        projected.append(time.perf_counter() - start)
+    return {
+        "decoder": projection.decoder,
+        "bytes": len(body),
+        "fullParse": min(full),
+        "projectedParse": min(projected),
+        "saved": min(full) - min(projected),
+    }
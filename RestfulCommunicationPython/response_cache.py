@@ -0,0 +1,179 @@
+"""
+Response cache used by the Gateway class to avoid downloading unchanged resources again.
+"""
+import threading
+import time
+import requests
+from collections import OrderedDict
+
+
+class CacheEntry:
+    """
+    Class representing a cached response.
+    """
+
+    def __init__(self, response: requests.Response):
+        """Constructor
+
+        :param response: The requests.Response object to cache
+        """
+        self.response = response
+        self.size = len(response.content)
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        self.stored_at = time.monotonic()
+
+    def has_validators(self) -> bool:
+        """Whether the server supplied an ETag or Last-Modified header for revalidation."""
+        return self.etag is not None or self.last_modified is not None
+
+    def validator_headers(self) -> dict:
+        """Headers making the next request conditional on the resource having changed."""
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    Class representing an LRU cache of GET responses, bounded by the total size of the bodies.
+
+    Responses carrying an ETag or Last-Modified header are revalidated on every use, so an
+    unchanged resource costs a 304 Not Modified instead of the full body. Other responses of
+    slowly changing configuration, like cameras and rules, are reused without contacting the
+    server until they are older than the TTL, and are otherwise fetched again every time.
+
+    Entries are kept per user, so a cache shared by several gateways, e.g. through a
+    TokenPool, never answers one user with the response to another.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 60.0,
+        ttl_resources: tuple = ("cameras", "rules", "userDefinedEvents"),
+    ):
+        """Constructor
+
+        :param max_bytes: The maximum total size of the cached response bodies
+        :param ttl: Seconds a response without validators is reused before it is fetched again
+        :param ttl_resources: The resource types whose lists and items are reused for ttl
+            seconds without validators. Responses of other types, like tasks, events and
+            alarms, change too often to be reused without asking the server.
+        """
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._ttl_resources = ttl_resources
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def lookup(self, key: str) -> CacheEntry:
+        """Finds the cached entry for a request.
+
+        :param key: The request URI including the query string, followed by "#" and an id
+            of the user, e.g. a hash of the token
+
+        :returns: The cached entry, or None if the request isn't cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry: CacheEntry, resource_plural: str = None) -> bool:
+        """Whether an entry may be used without contacting the server.
+
+        Counts a hit if it may.
+
+        :param entry: The cached entry
+        :param resource_plural: The resource type of the list or item requested, or None for
+            e.g. child items, which are never reused without asking the server
+        """
+        fresh = (
+            resource_plural in self._ttl_resources
+            and not entry.has_validators()
+            and time.monotonic() - entry.stored_at < self._ttl
+        )
+        if fresh:
+            with self._lock:
+                self.hits += 1
+        return fresh
+
+    def revalidated(self, entry: CacheEntry) -> requests.Response:
+        """Records that the server confirmed an entry is unchanged (304 Not Modified).
+
+        :param entry: The entry that was revalidated
+
+        :returns: The cached requests.Response object
+        """
+        with self._lock:
+            entry.stored_at = time.monotonic()
+            self.hits += 1
+            self.revalidations += 1
+        return entry.response
+
+    def store(self, key: str, response: requests.Response):
+        """Stores a response, evicting the least recently used entries to stay within budget.
+
+        :param key: The key, as for lookup()
+        :param response: The requests.Response object to store
+        """
+        entry = CacheEntry(response)
+        with self._lock:
+            self.misses += 1
+            self.__remove(key)
+            if entry.size > self._max_bytes:
+                return
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self._max_bytes:
+                oldest = next(iter(self._entries))
+                self.__remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, url: str):
+        """Removes all entries for a resource URI and anything below it, for all users.
+
+        :param url: The resource URI, e.g. https://vms.example.com/api/rest/v1/cameras
+        """
+        with self._lock:
+            for key in [
+                k
+                for k in self._entries
+                if k.startswith(url + "?")
+                or k.startswith(url + "/")
+                or k.startswith(url + "#")
+            ]:
+                self.__remove(key)
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        """Returns the cache counters and current size as a dict."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def __remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
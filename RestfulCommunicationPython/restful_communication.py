@@ -1,9 +1,25 @@
+import asyncio
 import json
 import requests
 import time
 import identity_provider
 import uuid
 from api_gateway import Gateway
+from async_api_gateway import AsyncGateway, create_session
+from http2_transport import Http2Session
+import bulk_operations
+from task_tracker import TaskTracker
+from fleet_tasks import FleetTaskRunner, get_recording_servers
+from task_catalog import TaskCatalog
+from config_crawler import ConfigCrawler
+from config_index import ConfigIndex
+import config_snapshot
+from instrumentation import Instrumentation
+from projection import Projection, compare_parse_time
+from retry_policy import GatewayError
+from token_cache import TokenCache
+from token_manager import TokenManager
+from token_pool import TokenPool
 
 
 def main():
@@ -54,11 +70,50 @@ def main():
     # cameraGuidId = 'a87d2b67-e37f-491e-b5b3-d058e9b48fa2'        # Replace value with the id of a PTZ camera
     # cameras_and_tasks(api_gateway, session, access_token, cameraGuidId)
 
+    # Demo of retrieving PTZ presets from several cameras at once
+    # cameraGuidIds = ['a87d2b67-e37f-491e-b5b3-d058e9b48fa2']      # Replace value with the ids of PTZ cameras
+    # asyncio.run(get_device_presets_concurrently(serverUrl, access_token, cameraGuidIds))
+
+    # Demo of retrieving PTZ presets from all cameras, writing the results to a JSONL file
+    # asyncio.run(get_device_presets_fleet(serverUrl, access_token, "presets.jsonl"))
+
+    # Demo of crawling the configuration into a local index and looking up items in it
+    # asyncio.run(crawl_configuration(serverUrl, access_token, "configuration.db"))
+
+    # Demo of reconciling user-defined events and rules with a desired state file
+    # asyncio.run(reconcile_configuration(serverUrl, access_token, "desired.json", "snapshot.json"))
+
     # Demo duplicating a rule
     # Find ruleId by calling /rules and pick the id of the rule that should be duplicated
     # ruleId = '[guid of the rule to duplicate]'
     # duplicate_rule(api_gateway, session, access_token, ruleId)
 
+    # Demo of retrieving many items concurrently through the asynchronous API Gateway
+    # asyncio.run(get_cameras_concurrently(serverUrl, access_token))
+    # The same, multiplexing all requests over a single HTTP/2 connection
+    # asyncio.run(get_cameras_concurrently(serverUrl, access_token, http2=True))
+    # The same with the synchronous Gateway, sending the requests one at a time over a single HTTP/2 connection
+    # get_cameras_over_http2(serverUrl, access_token)
+
+    # Demo of creating and deleting many user-defined events concurrently
+    # asyncio.run(bulk_user_defined_events(serverUrl, access_token, 100))
+
+    # Demo of measuring the latency and payload size of the requests sent through the API Gateway
+    # measure_requests(serverUrl, session, access_token)
+
+    # Demo of listing the ids and names of all cameras, decoding only those fields
+    # list_camera_names(api_gateway, session, access_token)
+
+    # Demo of a script started e.g. every minute by a scheduler, reusing the token of the previous run
+    # count_cameras_with_cached_token(serverUrl, session, username, password, isBasicUser)
+
+    # Demo of polling the cameras for longer than the lifetime of a token
+    # poll_cameras(serverUrl, session, username, password, isBasicUser, 2 * 3600)
+
+    # Demo of counting the cameras on several management servers, logging in to all of them at once
+    # identities = [(serverUrl, username, password, isBasicUser)]  # Add the servers and users to log in to
+    # asyncio.run(count_cameras_on_sites(identities))
+
 
 def crud_user_defined_event(
     api_gateway: Gateway, session: requests.Session, token: str
@@ -155,7 +210,9 @@ def cameras_and_tasks(
         return
 
     # Poll the status of the task started in the previous step
+    # Poll often at first, then less and less often the longer the task takes
     task_status = ""
+    poll_interval = 0.05
     while task_status != "Success":
         response = api_gateway.get_single(session, "tasks", task_id, token)
         if response.status_code == 200:
@@ -166,7 +223,8 @@ def cameras_and_tasks(
             error = response.json()["error"]
             print(error)
             return
-        time.sleep(0.5)
+        time.sleep(poll_interval)
+        poll_interval = min(poll_interval * 1.5, 2.0)
 
     # Clean up the task. This is done by starting a TaskCleanup task on the task.
     response = api_gateway.perform_task(
@@ -211,5 +269,339 @@ def duplicate_rule(api_gateway: Gateway, session: requests.Session, token: str,
         return
 
 
+def measure_requests(serverUrl: str, session: requests.Session, token: str):
+    """Run the CRUD demo through an instrumented API Gateway and print the collected metrics"""
+
+    def print_failed(record):
+        if record.status is None or record.status >= 400:
+            print(f"{record.verb} {record.resource_plural} failed: {record.status}")
+
+    instrumentation = Instrumentation()
+    instrumentation.add_post_hook(print_failed)
+    api_gateway = Gateway(serverUrl, instrumentation=instrumentation)
+    crud_user_defined_event(api_gateway, session, token)
+
+    # Resource types and methods taking the most time in total are listed first
+    print(f"Request metrics:\n{instrumentation.to_json()}\n\n")
+    print(instrumentation.to_prometheus())
+
+
+def count_cameras_with_cached_token(
+    serverUrl: str,
+    session: requests.Session,
+    username: str,
+    password: str,
+    isBasicUser: bool,
+):
+    """Count the cameras, reusing the token stored on disk by a previous run instead of logging in again"""
+    token_cache = TokenCache(serverUrl, username, isBasicUser)
+
+    def request_token():
+        return identity_provider.get_token(
+            session, username, password, serverUrl, isBasicUser
+        )
+
+    api_gateway = Gateway(serverUrl)
+    access_token = token_cache.get_token(request_token)
+    response = api_gateway.get(session, "cameras", access_token)
+    if response.status_code == 401:
+        # The cached token was revoked, e.g. by a restart of the server, so log in once more
+        token_cache.remove()
+        access_token = token_cache.get_token(request_token)
+        response = api_gateway.get(session, "cameras", access_token)
+    if response.status_code == 200:
+        print(f"{len(response.json()['array'])} cameras")
+    print(f"Token cache: {token_cache.stats()}\n\n")
+
+
+def poll_cameras(
+    serverUrl: str,
+    session: requests.Session,
+    username: str,
+    password: str,
+    isBasicUser: bool,
+    duration: float,
+    interval: float = 60,
+):
+    """Poll the number of cameras for duration seconds, letting a TokenManager renew the token in the background"""
+    token_manager = TokenManager(
+        lambda: identity_provider.get_token(
+            session, username, password, serverUrl, isBasicUser
+        )
+    )
+    token_manager.start()
+    api_gateway = Gateway(serverUrl, token_manager=token_manager)
+    try:
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            # The token argument is ignored, as the gateway takes the token from the manager
+            response = api_gateway.get(session, "cameras", None)
+            if response.status_code == 200:
+                print(
+                    f"{len(response.json()['array'])} cameras, "
+                    f"token expires in {token_manager.seconds_left():.0f} seconds"
+                )
+            time.sleep(interval)
+    finally:
+        token_manager.stop()
+
+
+def list_camera_names(api_gateway: Gateway, session: requests.Session, token: str):
+    """List the id and name of all cameras, and report the parse time saved by the projection"""
+
+    projection = Projection(["id", "displayName"])
+    for camera in api_gateway.get_paged(
+        session, "cameras", token, projection=projection
+    ):
+        print(f"Camera {camera.id}: {camera.displayName}")
+    print(f"Projection: {projection.stats()}")
+
+    response = api_gateway.get(session, "cameras", token)
+    if response.status_code == 200:
+        comparison = compare_parse_time(response.content, projection.fields)
+        print(f"Parse time of the full camera list:\n{json.dumps(comparison, indent=2)}\n\n")
+
+
+async def get_cameras_concurrently(serverUrl: str, token: str, http2: bool = False):
+    """Get all cameras, then retrieve each of them concurrently over a shared connection pool"""
+
+    async_gateway = AsyncGateway(serverUrl, max_concurrency=32)
+    async with create_session(http2=http2) as async_session:
+        response = await async_gateway.get(async_session, "cameras", token)
+        if response.status == 200:
+            camera_ids = [camera["id"] for camera in (await response.json())["array"]]
+        else:
+            error = (await response.json())["error"]
+            print(error)
+            return
+
+        # All requests are started at once; the gateway keeps at most 32 of them in flight
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *[
+                async_gateway.get_single(async_session, "cameras", camera_id, token)
+                for camera_id in camera_ids
+            ]
+        )
+        elapsed = time.perf_counter() - start
+        for response in responses:
+            if response.status == 200:
+                camera = (await response.json())["data"]
+                print(f"Camera: {camera['displayName']}")
+        print(f"Retrieved {len(responses)} cameras in {elapsed:.2f} seconds\n\n")
+
+
+def get_cameras_over_http2(serverUrl: str, token: str):
+    """Get all cameras, then retrieve each of them through the synchronous Gateway over a single HTTP/2 connection"""
+
+    api_gateway = Gateway(serverUrl)
+    with Http2Session() as http2_session:
+        response = api_gateway.get(http2_session, "cameras", token)
+        if response.status_code != 200:
+            print(response.json()["error"])
+            return
+        camera_ids = [camera["id"] for camera in response.json()["array"]]
+
+        start = time.perf_counter()
+        for camera_id in camera_ids:
+            response = api_gateway.get_single(http2_session, "cameras", camera_id, token)
+            if response.status_code == 200:
+                print(f"Camera: {response.json()['data']['displayName']}")
+        elapsed = time.perf_counter() - start
+        print(
+            f"Retrieved {len(camera_ids)} cameras in {elapsed:.2f} seconds using {response.http_version}\n\n"
+        )
+
+
+async def bulk_user_defined_events(serverUrl: str, token: str, count: int):
+    """Create a number of user-defined events, then delete them again, reporting the outcome per item"""
+
+    async_gateway = AsyncGateway(serverUrl)
+    async with create_session() as async_session:
+        # Create the user defined events
+        payloads = ({"name": f"my Python event {i}"} for i in range(count))
+        operation = bulk_operations.create_items(
+            async_gateway, async_session, "userDefinedEvents", payloads, token, limit=16
+        )
+        created_ids = []
+        async for result in operation:
+            if result.success:
+                created_ids.append(result.obj_id)
+            else:
+                print(f"Create item {result.index} failed: {result.error}")
+        print(f"Create items: {operation.summary}\n\n")
+
+        # Delete the user defined events that were created
+        operation = bulk_operations.delete_items(
+            async_gateway, async_session, "userDefinedEvents", created_ids, token, limit=16
+        )
+        async for result in operation:
+            if not result.success:
+                print(f"Delete item {result.obj_id} failed: {result.error}")
+        print(f"Delete items: {operation.summary}\n\n")
+
+
+async def get_device_presets_concurrently(serverUrl: str, token: str, camera_ids: list):
+    """Invoke a GetDevicePresets task on several PTZ cameras and wait for all of them at once"""
+
+    async_gateway = AsyncGateway(serverUrl)
+    async with create_session() as async_session:
+        # The tracker polls all tasks from one loop and cleans up each task when it has finished
+        tracker = TaskTracker(async_gateway, async_session, token)
+
+        def task_finished(task_id: str, task_data: dict):
+            print(f"GetDevicePresets task {task_id} finished: {task_data['state']}")
+
+        # sessionDataId should be set to 0 when invoking a new task
+        payload = json.dumps({"sessionDataId": 0})
+        responses = await asyncio.gather(
+            *[
+                async_gateway.perform_child_task(
+                    async_session,
+                    "cameras",
+                    camera_id,
+                    "ptzpresets",
+                    "GetDevicePresets",
+                    payload,
+                    token,
+                )
+                for camera_id in camera_ids
+            ]
+        )
+        for camera_id, response in zip(camera_ids, responses):
+            if response.status == 200:
+                task_id = (await response.json())["result"]["path"]["id"]
+                tracker.track(task_id, task_finished)
+            else:
+                error = (await response.json())["error"]
+                print(f"Camera {camera_id}: {error}")
+
+        await tracker.wait_all()
+
+
+async def get_device_presets_fleet(serverUrl: str, token: str, output_path: str):
+    """Invoke a GetDevicePresets task on all cameras supporting it, limiting the load per recording server"""
+
+    async_gateway = AsyncGateway(serverUrl, max_concurrency=64)
+    async with create_session() as async_session:
+        # Find the recording server of each camera
+        camera_servers = await get_recording_servers(
+            async_gateway, async_session, "cameras", token
+        )
+
+        # The available tasks are remembered between runs, until the server is upgraded
+        task_catalog = TaskCatalog("task_catalog.json")
+        await task_catalog.validate_async(async_gateway, async_session, token)
+
+        runner = FleetTaskRunner(
+            async_gateway,
+            async_session,
+            token,
+            "GetDevicePresets",
+            child_item_type="ptzpresets",
+            max_concurrency=64,
+            max_per_server=8,
+            task_catalog=task_catalog,
+        )
+        start = time.perf_counter()
+        counts = await runner.run("cameras", camera_servers.items(), output_path)
+        elapsed = time.perf_counter() - start
+        print(f"GetDevicePresets on {len(camera_servers)} cameras in {elapsed:.2f} seconds: {counts}\n\n")
+        task_catalog.save()
+
+
+async def count_cameras_on_sites(identities: list):
+    """Log in to several management servers concurrently, then count the cameras on each of them"""
+
+    token_pool = TokenPool()
+    for serverUrl, username, password, isBasicUser in identities:
+        token_pool.add(serverUrl, username, password, isBasicUser)
+    start = time.perf_counter()
+    try:
+        # Logging in blocks until every identity has its token, so it runs on a worker
+        # thread to keep the event loop responsive
+        failures = await asyncio.get_running_loop().run_in_executor(
+            None, token_pool.start
+        )
+        print(f"Logged in to {len(identities)} identities in {time.perf_counter() - start:.2f} seconds")
+        for (serverUrl, username, _), error in failures.items():
+            print(f"Login of {username} on {serverUrl} failed: {error}")
+
+        async with create_session() as async_session:
+            # Each gateway sends its requests with the token of its own identity
+            responses = await asyncio.gather(
+                *[
+                    token_pool.async_gateway(serverUrl, username, isBasicUser).get(
+                        async_session, "cameras", None
+                    )
+                    for serverUrl, username, _, isBasicUser in identities
+                ]
+            )
+            for (serverUrl, username, _, _), response in zip(identities, responses):
+                if response.status == 200:
+                    cameras = (await response.json())["array"]
+                    print(f"{serverUrl} ({username}): {len(cameras)} cameras")
+                else:
+                    print(f"{serverUrl} ({username}): status {response.status}")
+    finally:
+        token_pool.stop()
+
+
+async def crawl_configuration(serverUrl: str, token: str, index_path: str):
+    """Crawl recording servers, hardware and devices into a local index, then look up a camera's hardware"""
+
+    index = ConfigIndex(index_path)
+    async_gateway = AsyncGateway(serverUrl, max_concurrency=32)
+    async with create_session() as async_session:
+        crawler = ConfigCrawler(async_gateway, async_session, token, index)
+        start = time.perf_counter()
+        try:
+            counts = await crawler.crawl()
+        except GatewayError as err:
+            print(f"Crawl failed, the index was not changed: {err}")
+            index.close()
+            return
+        elapsed = time.perf_counter() - start
+        print(f"Crawled configuration in {elapsed:.2f} seconds: {counts}\n\n")
+
+    # Lookups are answered by the local index without calling the API Gateway
+    cameras = index.find_by_type("cameras")
+    if cameras:
+        camera = cameras[0]
+        hardware = index.parent(camera["id"])
+        recording_server = index.parent(hardware["id"])
+        print(
+            f"Camera {camera['name']} belongs to hardware {hardware['name']} on recording server {recording_server['name']}\n\n"
+        )
+    index.close()
+
+
+async def reconcile_configuration(
+    serverUrl: str, token: str, desired_path: str, snapshot_path: str
+):
+    """Snapshot user-defined events and rules, then apply only the changes needed to reach the desired state"""
+
+    desired = config_snapshot.load_snapshot(desired_path)
+    async_gateway = AsyncGateway(serverUrl)
+    async with create_session() as async_session:
+        try:
+            live = await config_snapshot.take_snapshot(
+                async_gateway, async_session, token, desired.keys()
+            )
+        except GatewayError as err:
+            print(f"Snapshot failed, nothing was changed: {err}")
+            return
+        config_snapshot.save_snapshot(live, snapshot_path)
+
+        changes = config_snapshot.diff(desired, live)
+        print(f"Changes needed:\n{changes}\n\n")
+
+        failures = await config_snapshot.apply_changes(
+            async_gateway, async_session, token, changes
+        )
+        for failure in failures:
+            print(f"Change failed: {failure}")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,257 @@
+"""
+Retry policy, circuit breaker and exceptions used by the Gateway and AsyncGateway classes.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+class GatewayError(Exception):
+    """
+    Base class of the errors raised by Gateway and AsyncGateway requests.
+    """
+
+
+class GatewayConnectionError(GatewayError):
+    """
+    Raised when the API Gateway could not be reached, or didn't respond in time, after all
+    retries.
+    """
+
+
+class CircuitOpenError(GatewayError):
+    """
+    Raised without contacting the API Gateway while its circuit breaker is open.
+    """
+
+
+class RetryPolicy:
+    """
+    Class deciding whether and when a failed request is retried.
+
+    Requests rejected with 429 Too Many Requests or 503 Service Unavailable are retried for
+    all methods, as the server didn't process them. Connection errors, timeouts, and 502 and
+    504 responses are only retried for idempotent methods, as a POST may already have been
+    processed. The delay grows exponentially with random jitter, and a Retry-After header is
+    honoured.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        retry_statuses: tuple = (429, 503),
+        idempotent_retry_statuses: tuple = (502, 504),
+        idempotent_methods: tuple = ("GET", "PUT", "DELETE"),
+    ):
+        """Constructor
+
+        :param max_retries: The maximum number of retries of a request
+        :param backoff_base: Seconds of the first delay, doubled for every following retry
+        :param backoff_max: The maximum number of seconds to wait before a retry. A request
+            whose Retry-After is longer is not retried.
+        :param retry_statuses: Status codes retried for all methods
+        :param idempotent_retry_statuses: Status codes retried for idempotent methods only
+        :param idempotent_methods: Methods that are safe to send again
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = retry_statuses
+        self.idempotent_retry_statuses = idempotent_retry_statuses
+        self.idempotent_methods = idempotent_methods
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.exhausted = 0
+
+    def retry_delay(
+        self,
+        verb: str,
+        attempt: int,
+        status: int = None,
+        headers: dict = None,
+        error: Exception = None,
+    ) -> float:
+        """Decides whether a request is retried.
+
+        :param verb: Request method
+        :param attempt: The number of retries made so far
+        :param status: The status code of the response, if one was received
+        :param headers: The headers of the response, if one was received
+        :param error: The connection error or timeout, if no response was received
+
+        :returns: Seconds to wait before retrying, or None if the request is not retried
+        """
+        idempotent = verb in self.idempotent_methods
+        if error is not None:
+            retryable = idempotent
+        else:
+            retryable = status in self.retry_statuses or (
+                idempotent and status in self.idempotent_retry_statuses
+            )
+        if not retryable:
+            return None
+
+        with self._lock:
+            if attempt >= self.max_retries:
+                self.exhausted += 1
+                return None
+
+            retry_after = _parse_retry_after(headers)
+            if retry_after is not None:
+                if retry_after > self.backoff_max:
+                    self.exhausted += 1
+                    return None
+                delay = retry_after
+            else:
+                # Full jitter spreads the retries of concurrent requests
+                delay = random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * 2**attempt)
+                )
+            self.retries += 1
+            return delay
+
+    def stats(self) -> dict:
+        """Returns the retry counters as a dict."""
+        with self._lock:
+            return {"retries": self.retries, "exhausted": self.exhausted}
+
+
+class CircuitBreaker:
+    """
+    Class stopping requests to an API Gateway that keeps failing.
+
+    After failure_threshold consecutive failures (connection errors, timeouts, or responses
+    with one of failure_statuses, by default 429, 502, 503 and 504), the breaker opens and requests fail with CircuitOpenError right away.
+    After reset_timeout seconds, a single trial request is let through; the breaker closes
+    if it succeeds and opens again if it fails. If the trial doesn't report back within
+    another reset_timeout seconds, e.g. because it was cancelled, a new trial is let through.
+
+    Other responses, including 500 Internal Server Error, come from a gateway that is up, and
+    count as successes, so that a request failing on one resource doesn't block the others.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        failure_statuses: tuple = (429, 502, 503, 504),
+    ):
+        """Constructor
+
+        :param failure_threshold: The number of consecutive failures opening the breaker
+        :param reset_timeout: Seconds the breaker stays open before a trial request
+        :param failure_statuses: Response statuses telling that the API Gateway, or a server
+            behind it, is down or overloaded
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_statuses = failure_statuses
+        self.state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now. Counts a rejection if it may not."""
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_timeout:
+                # When half-open, the previous trial never reported back
+                self.state = CircuitBreaker.HALF_OPEN
+                self._opened_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def allow_or_raise(self, url: str):
+        """Raises CircuitOpenError if a request to url may not be sent now."""
+        if not self.allow():
+            raise CircuitOpenError(
+                f"Circuit breaker open, not sending request to {url}"
+            )
+
+    def release_trial(self):
+        """Records a request that ended without a result, e.g. because it was cancelled.
+        If it was the trial request, the next request becomes the trial."""
+        with self._lock:
+            if self.state == CircuitBreaker.HALF_OPEN:
+                self.state = CircuitBreaker.OPEN
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def record_response(self, status: int):
+        """Records a request that received a response with the given status."""
+        if status in self.failure_statuses:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        """Records a request that reached a healthy API Gateway."""
+        with self._lock:
+            self._failures = 0
+            self.state = CircuitBreaker.CLOSED
+
+    def record_failure(self):
+        """Records a failed request, opening the breaker if needed."""
+        with self._lock:
+            self._failures += 1
+            if (
+                self.state == CircuitBreaker.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self.state != CircuitBreaker.OPEN:
+                    self.opened += 1
+                self.state = CircuitBreaker.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """Returns the state and counters of the breaker as a dict."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(serverUrl: str) -> CircuitBreaker:
+    """Returns the circuit breaker shared by all gateways for the host of serverUrl.
+
+    :param serverUrl: The URL of the API Gateway, e.g. https://vms.example.com
+    """
+    host = urlparse(serverUrl).netloc
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker()
+        return _circuit_breakers[host]
+
+
+def _parse_retry_after(headers) -> float:
+    """Returns the seconds of a Retry-After header, given as seconds or as an HTTP date."""
+    if not headers or "Retry-After" not in headers:
+        return None
+    value = headers["Retry-After"]
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,247 @@
+"""
+TaskCatalog class used for remembering which tasks are available per resource type.
+"""
+import asyncio
+import json
+import os
+import threading
+import aiohttp
+import requests
+from typing import Iterable, List, Tuple
+from api_gateway import Gateway
+from async_api_gateway import AsyncGateway
+
+
+class TaskCatalog:
+    """
+    Class caching the tasks available per resource type and child item type.
+
+    The tasks of a resource type, or of a child item type of a resource type, only change when
+    the server is upgraded. The catalog asks the server once per type, when the tasks are
+    first needed or when populated up front, and can be saved to a file and loaded in the
+    next run. It is cleared when the version of the server differs from the version it was
+    built for.
+
+    The catalog assumes that all items of a type offer the same tasks. An item lacking a
+    task, e.g. a camera without PTZ, is then only detected when performing the task fails.
+    Only non-empty answers are stored, so a type the server failed to answer for, or listed
+    no tasks for, is asked again the next time. Use one catalog per server.
+    """
+
+    def __init__(self, path: str = None):
+        """Constructor
+
+        :param path: Optional path of a JSON file to load the catalog from and save it to
+        """
+        self.path = path
+        self.server_version = None
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                stored = json.load(f)
+            self.server_version = stored.get("serverVersion")
+            self._tasks = stored.get("tasks", {})
+
+    def lookup(self, resource_plural: str, child_item_type: str = None) -> List[dict]:
+        """Looks up the tasks of a type without contacting the server.
+
+        :param resource_plural: The name of the resource type, e.g. cameras
+        :param child_item_type: Optional child item type, e.g. ptzpresets
+
+        :returns: List of tasks as returned by the server, or None if not in the catalog
+        """
+        key = _key(resource_plural, child_item_type)
+        with self._lock:
+            tasks = self._tasks.get(key)
+            if tasks is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return tasks
+
+    def store(self, resource_plural: str, child_item_type: str, tasks: List[dict]):
+        """Stores the tasks of a type.
+
+        :param resource_plural: The name of the resource type, e.g. cameras
+        :param child_item_type: The child item type, e.g. ptzpresets, or None
+        :param tasks: The 'tasks' array returned by the server
+        """
+        with self._lock:
+            self._tasks[_key(resource_plural, child_item_type)] = tasks
+
+    def supports(
+        self, task: str, resource_plural: str, child_item_type: str = None
+    ) -> bool:
+        """Whether the catalog lists a task for a type.
+
+        :returns: True or False, or None if the type is not in the catalog
+        """
+        tasks = self.lookup(resource_plural, child_item_type)
+        if tasks is None:
+            return None
+        return any(entry["id"] == task for entry in tasks)
+
+    def set_server_version(self, version: str):
+        """Clears the catalog if it was built for another version of the server."""
+        with self._lock:
+            if version != self.server_version:
+                self._tasks = {}
+                self.server_version = version
+
+    def clear(self):
+        """Removes all types from the catalog."""
+        with self._lock:
+            self._tasks = {}
+
+    def save(self):
+        """Writes the catalog to its file. Does nothing if the catalog has no path."""
+        if self.path is None:
+            return
+        with self._lock:
+            stored = {"serverVersion": self.server_version, "tasks": self._tasks}
+        with open(self.path, "w") as f:
+            json.dump(stored, f, indent=2)
+
+    def stats(self) -> dict:
+        """Returns the number of types in the catalog and the hit and miss counters."""
+        with self._lock:
+            return {"types": len(self._tasks), "hits": self.hits, "misses": self.misses}
+
+    def validate(self, api_gateway: Gateway, session: requests.Session, token: str):
+        """Reads the version of the server, and clears the catalog if it has changed.
+
+        :param api_gateway: The Gateway to send the request through
+        :param session: A requests.Session object
+        :param token: The bearer access token to use
+        """
+        response = api_gateway.get(session, "sites", token)
+        if response.status_code == 200:
+            self.set_server_version(_server_version(response.json()))
+
+    def get_tasks(
+        self,
+        api_gateway: Gateway,
+        session: requests.Session,
+        token: str,
+        resource_plural: str,
+        obj_id: str = None,
+        child_item_type: str = None,
+    ) -> List[dict]:
+        """Returns the tasks of a type, asking the server if they are not in the catalog.
+
+        :param api_gateway: The Gateway to send the request through
+        :param session: A requests.Session object
+        :param token: The bearer access token to use
+        :param resource_plural: The name of the resource type, e.g. cameras
+        :param obj_id: The id of an item of the type, needed to get child item tasks
+        :param child_item_type: Optional child item type, e.g. ptzpresets
+
+        :returns: List of tasks, or None if the server didn't return them
+        """
+        tasks = self.lookup(resource_plural, child_item_type)
+        if tasks is not None:
+            return tasks
+        if child_item_type is None:
+            response = api_gateway.get_tasks(session, resource_plural, token)
+        else:
+            response = api_gateway.get_child_item_tasks(
+                session, resource_plural, obj_id, child_item_type, token
+            )
+        if response.status_code != 200:
+            return None
+        tasks = response.json()["tasks"]
+        if tasks:
+            self.store(resource_plural, child_item_type, tasks)
+        return tasks
+
+    async def validate_async(
+        self, api_gateway: AsyncGateway, session: aiohttp.ClientSession, token: str
+    ):
+        """Like validate(), using an AsyncGateway."""
+        response = await api_gateway.get(session, "sites", token)
+        if response.status == 200:
+            self.set_server_version(_server_version(await response.json()))
+
+    async def get_tasks_async(
+        self,
+        api_gateway: AsyncGateway,
+        session: aiohttp.ClientSession,
+        token: str,
+        resource_plural: str,
+        obj_id: str = None,
+        child_item_type: str = None,
+    ) -> List[dict]:
+        """Like get_tasks(), using an AsyncGateway.
+
+        Concurrent calls for the same type send a single request to the server.
+        """
+        tasks = self.lookup(resource_plural, child_item_type)
+        if tasks is not None:
+            return tasks
+
+        key = _key(resource_plural, child_item_type)
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                self.__fetch(
+                    api_gateway, session, token, resource_plural, obj_id, child_item_type
+                )
+            )
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+            self._pending[key] = future
+        # Shielded, so that a cancelled caller doesn't cancel the request for the others
+        return await asyncio.shield(future)
+
+    async def populate(
+        self,
+        api_gateway: AsyncGateway,
+        session: aiohttp.ClientSession,
+        token: str,
+        types: Iterable[Tuple[str, str, str]],
+    ):
+        """Fills in the catalog up front, asking the server for all missing types at once.
+
+        :param api_gateway: The AsyncGateway to send the requests through
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param token: The bearer access token to use
+        :param types: Tuples of a resource type, the id of an item of the type (or None),
+            and a child item type (or None), e.g. [("cameras", camera_id, "ptzpresets")]
+        """
+        await asyncio.gather(
+            *[
+                self.get_tasks_async(
+                    api_gateway, session, token, resource_plural, obj_id, child_item_type
+                )
+                for resource_plural, obj_id, child_item_type in types
+            ]
+        )
+
+    async def __fetch(
+        self, api_gateway, session, token, resource_plural, obj_id, child_item_type
+    ) -> List[dict]:
+        if child_item_type is None:
+            response = await api_gateway.get_tasks(session, resource_plural, token)
+        else:
+            response = await api_gateway.get_child_item_tasks(
+                session, resource_plural, obj_id, child_item_type, token
+            )
+        if response.status != 200:
+            return None
+        tasks = (await response.json())["tasks"]
+        if tasks:
+            self.store(resource_plural, child_item_type, tasks)
+        return tasks
+
+
+def _key(resource_plural: str, child_item_type: str) -> str:
+    if child_item_type is None:
+        return resource_plural
+    return f"{resource_plural}/{child_item_type}"
+
+
+def _server_version(sites: dict) -> str:
+    return sites["array"][0].get("version") if sites["array"] else None
@@ -0,0 +1,157 @@
+"""
+TaskTracker class used for waiting for the completion of many tasks at once.
+"""
+import asyncio
+import time
+import aiohttp
+from typing import Callable
+from async_api_gateway import AsyncGateway
+
+# Task states after which a task will not change anymore
+FINISHED_STATES = ("Success", "Error")
+
+
+class TaskPollError(Exception):
+    """
+    Raised through the future of a task whose status could not be retrieved.
+    """
+
+
+class _TrackedTask:
+    def __init__(self, future: asyncio.Future, callback: Callable, interval: float):
+        self.future = future
+        self.callback = callback
+        self.interval = interval
+        self.next_poll = time.monotonic() + interval
+
+
+class TaskTracker:
+    """
+    Class tracking the state of tasks started with perform_task or perform_child_task.
+
+    All tracked tasks are polled from a single loop. Each task is first polled shortly after
+    it is tracked, and the interval between polls then grows with every poll, so short tasks
+    complete quickly while long tasks don't flood the API Gateway.
+    When a task finishes, its future is resolved, its callback is called, and a TaskCleanup
+    task is started on it.
+    """
+
+    def __init__(
+        self,
+        api_gateway: AsyncGateway,
+        session: aiohttp.ClientSession,
+        token: str,
+        initial_interval: float = 0.05,
+        max_interval: float = 2.0,
+        backoff: float = 1.5,
+        cleanup: bool = True,
+    ):
+        """Constructor
+
+        :param api_gateway: The AsyncGateway to poll the tasks through
+        :param session: An aiohttp.ClientSession object shared by all calls
+        :param token: The bearer access token to use
+        :param initial_interval: Seconds before a task is polled for the first time
+        :param max_interval: The maximum number of seconds between two polls of a task
+        :param backoff: The factor the poll interval of a task grows by after each poll
+        :param cleanup: Whether to start a TaskCleanup task on each task when it has finished
+        """
+        self._api_gateway = api_gateway
+        self._session = session
+        self._token = token
+        self._initial_interval = initial_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._cleanup = cleanup
+        self._tasks = {}
+        self._wakeup = None
+        self._poller = None
+
+    def track(
+        self, task_id: str, callback: Callable[[str, dict], None] = None
+    ) -> asyncio.Future:
+        """Starts tracking a task.
+
+        :param task_id: The id of the task, as returned in result.path.id when starting it
+        :param callback: Optional function called with the task id and task data when the
+            task has finished. An exception raised by it is printed, and doesn't affect the
+            tracking of the other tasks.
+
+        :returns: asyncio.Future resolved with the task data when the task has finished.
+            Check the 'state' property of the task data for "Success" or "Error".
+        """
+        if task_id in self._tasks:
+            return self._tasks[task_id].future
+
+        future = asyncio.get_running_loop().create_future()
+        self._tasks[task_id] = _TrackedTask(future, callback, self._initial_interval)
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self.__poll())
+        return future
+
+    async def wait_all(self):
+        """Waits until all tracked tasks have finished."""
+        futures = [tracked.future for tracked in self._tasks.values()]
+        await asyncio.gather(*futures, return_exceptions=True)
+        if self._poller is not None:
+            await self._poller
+
+    async def __poll(self):
+        while self._tasks:
+            now = time.monotonic()
+            due = [task_id for task_id, t in self._tasks.items() if t.next_poll <= now]
+            if due:
+                await asyncio.gather(*[self.__poll_task(task_id) for task_id in due])
+                continue
+
+            # Sleep until the next task is due, or until a new task is tracked
+            self._wakeup.clear()
+            timeout = min(t.next_poll for t in self._tasks.values()) - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __poll_task(self, task_id: str):
+        tracked = self._tasks[task_id]
+        try:
+            response = await self._api_gateway.get_single(
+                self._session, "tasks", task_id, self._token
+            )
+            if response.status != 200:
+                error = (await response.json(content_type=None) or {}).get("error")
+                raise TaskPollError(f"Task {task_id}: {response.status} {error}")
+            task_data = (await response.json())["data"]
+        except Exception as err:
+            del self._tasks[task_id]
+            if not tracked.future.done():
+                tracked.future.set_exception(
+                    err if isinstance(err, TaskPollError) else TaskPollError(str(err))
+                )
+            return
+
+        if task_data["state"] not in FINISHED_STATES:
+            tracked.interval = min(tracked.interval * self._backoff, self._max_interval)
+            tracked.next_poll = time.monotonic() + tracked.interval
+            return
+
+        del self._tasks[task_id]
+        if not tracked.future.done():
+            tracked.future.set_result(task_data)
+        if tracked.callback is not None:
+            try:
+                tracked.callback(task_id, task_data)
+            except Exception as err:
+                # Stopping the poll loop would leave the other tasks, and wait_all(), hanging
+                print(f"Callback of task {task_id} failed: {err}")
+
+        if self._cleanup:
+            try:
+                await self._api_gateway.perform_task(
+                    self._session, "tasks", task_id, "TaskCleanup", "{}", self._token
+                )
+            except Exception as err:
+                print(f"TaskCleanup of task {task_id} failed: {err}")
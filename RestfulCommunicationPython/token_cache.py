@@ -0,0 +1,165 @@
+"""
+TokenCache class used for reusing a bearer access token across runs of a script.
+"""
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+from typing import Callable, Tuple
+from token_manager import TokenError
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+# Serializes updating the file from several threads, e.g. the token managers of a TokenPool
+_file_lock = threading.Lock()
+
+
+class TokenCache:
+    """
+    Class storing the token of a user on disk, so that the next run of a script can reuse it
+    instead of logging in again.
+
+    The cache file holds one token per server, user and authentication type. It is written
+    with permissions allowing only the owner to read it, and a file that others can read is
+    ignored. With an encryption key, the file is encrypted with Fernet from the cryptography
+    package, installed with "pip install cryptography".
+
+    A token is only reused when it is valid for at least min_validity more seconds.
+    """
+
+    def __init__(
+        self,
+        serverUrl: str,
+        username: str,
+        isBasicUser: bool,
+        path: str = None,
+        encryption_key: bytes = None,
+        min_validity: float = 60.0,
+    ):
+        """Constructor
+
+        :param serverUrl: The URL of the API Gateway, e.g. "https://vms.example.com"
+        :param username: The username the token is issued for
+        :param isBasicUser: Whether the token is issued using basic authentication
+        :param path: Path of the cache file, by default .mip_token_cache in the home directory
+        :param encryption_key: Optional key to encrypt the file with, e.g. from
+            Fernet.generate_key()
+        :param min_validity: Seconds a cached token must still be valid for to be reused
+        """
+        if encryption_key is not None and Fernet is None:
+            raise ImportError(
+                "Encrypting the token cache requires the cryptography package"
+            )
+        self.path = path or os.path.join(os.path.expanduser("~"), ".mip_token_cache")
+        self.min_validity = min_validity
+        self._fernet = Fernet(encryption_key) if encryption_key is not None else None
+        self._key = hashlib.sha256(
+            f"{serverUrl}|{username}|{'basic' if isBasicUser else 'windows'}".encode()
+        ).hexdigest()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> Tuple[str, float]:
+        """Looks up the cached token.
+
+        :returns: Tuple of the token and the number of seconds it is valid for, or None if
+            there is no token valid for at least min_validity seconds
+        """
+        entry = self.__read().get(self._key)
+        if entry is not None:
+            seconds_left = entry["expiresAt"] - time.time()
+            if seconds_left >= self.min_validity:
+                self.hits += 1
+                return entry["accessToken"], seconds_left
+        self.misses += 1
+        return None
+
+    def store(self, token_response: dict):
+        """Stores a token.
+
+        :param token_response: The JSON response of the identity provider
+        """
+        with _file_lock:
+            entries = self.__read()
+            now = time.time()
+            # Drop the expired tokens of other users while the file is rewritten anyway
+            entries = {
+                key: entry for key, entry in entries.items() if entry["expiresAt"] > now
+            }
+            entries[self._key] = {
+                "accessToken": token_response["access_token"],
+                "expiresAt": now + float(token_response.get("expires_in", 3600)),
+            }
+            self.__write(entries)
+
+    def remove(self):
+        """Removes the cached token, e.g. after the server rejected it."""
+        with _file_lock:
+            entries = self.__read()
+            if entries.pop(self._key, None) is not None:
+                self.__write(entries)
+
+    def get_token(self, request_token: Callable) -> str:
+        """Returns the cached token, or requests a new one and caches it.
+
+        :param request_token: Function without arguments requesting a new token, returning the
+            requests.Response from the identity provider, e.g.
+            lambda: identity_provider.get_token(session, username, password, serverUrl, True)
+
+        :returns: The bearer access token
+        :raises TokenError: If the identity provider didn't issue a token
+        """
+        cached = self.load()
+        if cached is not None:
+            return cached[0]
+        response = request_token()
+        if response.status_code != 200:
+            raise TokenError(
+                f"Token request failed with status {response.status_code}", response
+            )
+        token_response = response.json()
+        self.store(token_response)
+        return token_response["access_token"]
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters."""
+        return {"hits": self.hits, "misses": self.misses}
+
+    def __read(self) -> dict:
+        try:
+            with open(self.path, "rb") as f:
+                if os.name != "nt" and os.fstat(f.fileno()).st_mode & (
+                    stat.S_IRWXG | stat.S_IRWXO
+                ):
+                    print(f"Ignoring token cache {self.path}, as others can access it")
+                    return {}
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        # A file written with another key, without encryption, or corrupted is ignored
+        if self._fernet is not None:
+            try:
+                data = self._fernet.decrypt(data)
+            except InvalidToken:
+                return {}
+        try:
+            return json.loads(data)
+        except ValueError:
+            return {}
+
+    def __write(self, entries: dict):
+        data = json.dumps(entries).encode()
+        if self._fernet is not None:
+            data = self._fernet.encrypt(data)
+        # Written to a temporary file only the owner can access, and then renamed, so that
+        # a script running at the same time never reads a partially written file
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,238 @@
+"""
+TokenManager class used for keeping a bearer access token valid for the duration of an
+integration.
+"""
+import asyncio
+import threading
+import time
+from typing import Callable
+
+
+class TokenError(Exception):
+    """
+    Raised when the identity provider didn't issue a token.
+    """
+
+    def __init__(self, message: str, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class TokenManager:
+    """
+    Class holding a bearer access token and renewing it before it expires.
+
+    The token is requested by calling a function, typically identity_provider.get_token(), and
+    renewed when refresh_margin seconds of its lifetime are left, or halfway through its
+    lifetime if that is sooner. Once start() has been called, a background thread renews the
+    token ahead of time, so callers never wait for the identity provider. Without it, or if a
+    background renewal failed, the token is renewed when it is requested.
+
+    A failed background renewal is retried after retry_interval seconds, doubling the wait
+    after each failure up to max_retry_interval. If the identity provider rejects the request
+    with a 4xx status other than 429, the credentials are not sent again: the background
+    renewal stops, and once the current token has expired, requesting a token raises the
+    same TokenError without contacting the identity provider, so that a wrong or expired
+    password doesn't lock the account. Calling start() again retries the credentials.
+
+    Concurrent renewals are coalesced into a single call to the identity provider. Tokens can
+    be requested from any thread with get_token(), and from asyncio code with
+    get_token_async(), which doesn't block the event loop.
+
+    With a TokenCache, the first token is taken from the cache if it is still valid, and
+    renewed tokens are stored in it for the next run.
+    """
+
+    def __init__(
+        self,
+        request_token: Callable,
+        refresh_margin: float = 60.0,
+        retry_interval: float = 5.0,
+        max_retry_interval: float = 300.0,
+        token_cache=None,
+    ):
+        """Constructor
+
+        :param request_token: Function without arguments requesting a new token, returning the
+            requests.Response from the identity provider, e.g.
+            lambda: identity_provider.get_token(session, username, password, serverUrl, True)
+        :param refresh_margin: Seconds before expiry at which the token is renewed
+        :param retry_interval: Seconds to wait before retrying a failed background renewal
+        :param max_retry_interval: The longest wait between retries of a background renewal
+        :param token_cache: Optional TokenCache to reuse a token from a previous run
+        """
+        self._request_token = request_token
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.token_cache = token_cache
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._state_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        # The TokenError of the identity provider rejecting the credentials, if it did
+        self._rejected = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def get_token(self) -> str:
+        """Returns a valid token, renewing it first if it has expired or is about to.
+
+        :raises TokenError: If a new token was needed and the identity provider refused it
+        """
+        token = self.__current()
+        if token is not None:
+            return token
+        return self.__renew(self._token)
+
+    async def get_token_async(self) -> str:
+        """Like get_token(), renewing the token on a worker thread if needed."""
+        token = self.__current()
+        if token is not None:
+            return token
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.__renew, self._token
+        )
+
+    def renew(self, rejected_token: str) -> str:
+        """Renews a token the server rejected, e.g. with 401 Unauthorized.
+
+        If another caller already replaced the rejected token, the new token is returned
+        without contacting the identity provider.
+
+        :param rejected_token: The token that was rejected
+        """
+        return self.__renew(rejected_token, force=True)
+
+    async def renew_async(self, rejected_token: str) -> str:
+        """Like renew(), on a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.__renew, rejected_token, True
+        )
+
+    def start(self):
+        """Starts renewing the token in the background ahead of its expiry, retrying the
+        credentials if the identity provider rejected them before."""
+        if self._thread is None:
+            self._rejected = None
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self.__refresh_loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background renewal."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def seconds_left(self) -> float:
+        """Returns the number of seconds until the current token expires."""
+        with self._state_lock:
+            return max(0.0, self._expires_at - time.monotonic())
+
+    def stats(self) -> dict:
+        """Returns the renewal counters as a dict."""
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "secondsLeft": self.seconds_left(),
+        }
+
+    def __current(self) -> str:
+        """Returns the token if it can be used without renewing it first, otherwise None."""
+        with self._state_lock:
+            token, refresh_at, expires_at = self._token, self._refresh_at, self._expires_at
+        now = time.monotonic()
+        if token is None or now >= expires_at:
+            return None
+        # While the background thread is renewing, the current token is used until it expires
+        if now < refresh_at or self._thread is not None:
+            return token
+        return None
+
+    def __renew(self, stale_token: str, force: bool = False) -> str:
+        # Only one caller at a time asks the identity provider. The others wait here, and
+        # then find that the token was replaced while they waited.
+        with self._refresh_lock:
+            with self._state_lock:
+                token, refresh_at = self._token, self._refresh_at
+                expires_at = self._expires_at
+            if token is not None and token != stale_token:
+                return token
+            if not force and token is not None and time.monotonic() < refresh_at:
+                return token
+            if self._rejected is not None:
+                # Never send rejected credentials again; use the token while it lasts
+                if not force and token is not None and time.monotonic() < expires_at:
+                    return token
+                raise self._rejected
+            if self.token_cache is not None:
+                if token is None and not force:
+                    cached = self.token_cache.load()
+                    if cached is not None:
+                        return self.__set_token(*cached)
+                elif force:
+                    self.token_cache.remove()
+
+            try:
+                response = self._request_token()
+            except Exception as err:
+                self.failures += 1
+                raise TokenError(f"Token request failed: {err}") from err
+            if response.status_code != 200:
+                self.failures += 1
+                error = TokenError(
+                    f"Token request failed with status {response.status_code}", response
+                )
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    self._rejected = error
+                raise error
+
+            token_response = response.json()
+            if self.token_cache is not None:
+                self.token_cache.store(token_response)
+            self.refreshes += 1
+            return self.__set_token(
+                token_response["access_token"],
+                float(token_response.get("expires_in", 3600)),
+            )
+
+    def __set_token(self, token: str, expires_in: float) -> str:
+        now = time.monotonic()
+        with self._state_lock:
+            self._token = token
+            self._expires_at = now + expires_in
+            self._refresh_at = now + max(
+                expires_in - self.refresh_margin, expires_in / 2
+            )
+        return token
+
+    def __refresh_loop(self):
+        failed = 0
+        while not self._stopped.is_set():
+            with self._state_lock:
+                token, refresh_at = self._token, self._refresh_at
+            wait = refresh_at - time.monotonic()
+            if token is not None and wait > 0:
+                self._stopped.wait(wait)
+                continue
+            try:
+                self.__renew(token)
+                failed = 0
+            except TokenError as err:
+                print(err)
+                if self._rejected is not None:
+                    # The credentials were rejected, and retrying them could lock the account
+                    print("Stopped renewing the token in the background")
+                    with self._state_lock:
+                        self._thread = None
+                    return
+                # The current token may still be valid for a while, so keep trying, less often
+                self._stopped.wait(
+                    min(self.retry_interval * 2**failed, self.max_retry_interval)
+                )
+                failed += 1
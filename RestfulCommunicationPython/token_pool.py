@@ -0,0 +1,161 @@
+"""
+TokenPool class used for keeping the tokens of several users on several servers valid.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
+import requests
+import identity_provider
+from api_gateway import Gateway
+from async_api_gateway import AsyncGateway
+from token_cache import TokenCache
+from token_manager import TokenError, TokenManager
+
+
+class TokenPool:
+    """
+    Class holding a TokenManager per server, username and authentication type.
+
+    Identities are added with add(), and start() logs in to all of them concurrently, so a
+    job spanning many servers doesn't wait for one login after the other. After that, each
+    token is renewed in the background before it expires.
+
+    Each identity gets its own requests.Session for its token requests, as the Windows
+    authentication handshake is tied to the connection of a session.
+    """
+
+    def __init__(self, refresh_margin: float = 60.0, cache_path: str = None):
+        """Constructor
+
+        :param refresh_margin: Seconds before expiry at which each token is renewed
+        :param cache_path: Optional path of a TokenCache file to reuse the tokens of a
+            previous run from
+        """
+        self.refresh_margin = refresh_margin
+        self.cache_path = cache_path
+        self._managers: Dict[Tuple[str, str, bool], TokenManager] = {}
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def add(
+        self, serverUrl: str, username: str, password: str, isBasicUser: bool = True
+    ) -> TokenManager:
+        """Adds an identity to the pool. Adding an identity twice returns the same manager.
+
+        :param serverUrl: The URL of the API Gateway, e.g. "https://vms.example.com"
+        :param username: The username of an XProtect user
+        :param password: The password of the user
+        :param isBasicUser: Whether to log in using basic authentication
+
+        :returns: The TokenManager of the identity
+        """
+        key = (serverUrl, username, isBasicUser)
+        with self._lock:
+            manager = self._managers.get(key)
+            if manager is not None:
+                return manager
+            session = requests.Session()
+            self._sessions.append(session)
+            token_cache = None
+            if self.cache_path is not None:
+                token_cache = TokenCache(
+                    serverUrl, username, isBasicUser, path=self.cache_path
+                )
+            manager = TokenManager(
+                lambda: identity_provider.get_token(
+                    session, username, password, serverUrl, isBasicUser
+                ),
+                refresh_margin=self.refresh_margin,
+                token_cache=token_cache,
+            )
+            self._managers[key] = manager
+            return manager
+
+    def start(self, max_workers: int = 16) -> Dict[Tuple[str, str, bool], TokenError]:
+        """Logs in to all identities concurrently, and starts renewing their tokens.
+
+        :param max_workers: The maximum number of logins in progress at a time
+
+        :returns: dict of the identities that failed to log in, keyed by (serverUrl,
+            username, isBasicUser), with the error of each. Their tokens aren't renewed in
+            the background. If the credentials were rejected, requesting their token raises
+            the same error without contacting the identity provider again.
+        """
+        with self._lock:
+            managers = dict(self._managers)
+        failures = {}
+
+        def login(key, manager):
+            try:
+                manager.get_token()
+            except TokenError as err:
+                # Retrying rejected credentials in the background could lock the account
+                failures[key] = err
+                return
+            manager.start()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for key, manager in managers.items():
+                executor.submit(login, key, manager)
+        return failures
+
+    def stop(self):
+        """Stops renewing the tokens and closes the sessions."""
+        with self._lock:
+            managers = list(self._managers.values())
+            sessions, self._sessions = self._sessions, []
+        for manager in managers:
+            manager.stop()
+        for session in sessions:
+            session.close()
+
+    def manager(
+        self, serverUrl: str, username: str, isBasicUser: bool = True
+    ) -> TokenManager:
+        """Returns the TokenManager of an identity.
+
+        :raises KeyError: If the identity hasn't been added
+        """
+        with self._lock:
+            return self._managers[(serverUrl, username, isBasicUser)]
+
+    def get_token(self, serverUrl: str, username: str, isBasicUser: bool = True) -> str:
+        """Returns the current token of an identity, e.g. for the Authorization header of a
+        WebSocket connection.
+        """
+        return self.manager(serverUrl, username, isBasicUser).get_token()
+
+    def gateway(
+        self, serverUrl: str, username: str, isBasicUser: bool = True, **kwargs
+    ) -> Gateway:
+        """Returns a Gateway sending its requests with the token of an identity.
+
+        :param kwargs: Other arguments for the Gateway, e.g. retry_policy
+        """
+        return Gateway(
+            serverUrl,
+            token_manager=self.manager(serverUrl, username, isBasicUser),
+            **kwargs,
+        )
+
+    def async_gateway(
+        self, serverUrl: str, username: str, isBasicUser: bool = True, **kwargs
+    ) -> AsyncGateway:
+        """Returns an AsyncGateway sending its requests with the token of an identity.
+
+        :param kwargs: Other arguments for the AsyncGateway, e.g. max_concurrency
+        """
+        return AsyncGateway(
+            serverUrl,
+            token_manager=self.manager(serverUrl, username, isBasicUser),
+            **kwargs,
+        )
+
+    def stats(self) -> dict:
+        """Returns the renewal counters of each identity, keyed by "username@serverUrl"."""
+        with self._lock:
+            managers = dict(self._managers)
+        return {
+            f"{username}@{serverUrl}": manager.stats()
+            for (serverUrl, username, _), manager in managers.items()
+        }